@@ -13,6 +13,39 @@ Since: 2019-08
 
 MAX_VALUE=1000000    # an upper bound (not necessarily tight) on the agents' values.
 
+MAX_ITEMS_TO_PRINT=20  # lists longer than this are printed in abbreviated form (head, tail and count).
+EDGE_ITEMS_TO_PRINT=3  # number of items printed at each edge of an abbreviated list.
+
+
+def abbreviated_list_str(items:list, max_items:int=None, edge_items:int=None)->str:
+    """
+    Format a list like str(list) does, but abbreviate it if it is long,
+    so that printing (or logging) a huge market does not format every single value.
+
+    :param max_items:  lists up to this length are printed in full. Default is MAX_ITEMS_TO_PRINT.
+    :param edge_items: number of items printed at the head and at the tail of an abbreviated list. Default is EDGE_ITEMS_TO_PRINT.
+
+    >>> abbreviated_list_str([9, 7, 6])
+    '[9, 7, 6]'
+    >>> abbreviated_list_str([])
+    '[]'
+    >>> abbreviated_list_str(list(range(100,0,-1)))
+    '[100, 99, 98, ..., 3, 2, 1] (100 items)'
+    >>> abbreviated_list_str(list(range(10)), max_items=5, edge_items=2)
+    '[0, 1, ..., 8, 9] (10 items)'
+    """
+    if max_items is None:
+        max_items = MAX_ITEMS_TO_PRINT
+    if edge_items is None:
+        edge_items = EDGE_ITEMS_TO_PRINT
+    num_items = len(items)
+    if num_items <= max_items or num_items <= 2*edge_items:
+        return "[{}]".format(", ".join(map(repr, items)))
+    head = ", ".join(map(repr, items[:edge_items]))
+    tail = ", ".join(map(repr, items[num_items-edge_items:]))
+    return "[{}, ..., {}] ({} items)".format(head, tail, num_items)
+
+
 class AgentCategory:
     """
     Represents a category of single-parametric agents in a market, for example: "buyers".
@@ -36,6 +69,8 @@ class AgentCategory:
     >>> a.append([3.2,3.8])
     >>> str(a)
     'buyer: [4, 3.8, 3.5, 3.2, 3]'
+    >>> str(AgentCategory("seller", range(-1,-1001,-1)))
+    'seller: [-1, -2, -3, ..., -998, -999, -1000] (1000 items)'
     """
     def __init__(self, name:str, values:list):
         self.name = name
@@ -49,7 +84,7 @@ class AgentCategory:
         return len(self.values)
 
     def __str__(self)->str:
-        return "{}: {}".format(self.name, self.values)
+        return "{}: {}".format(self.name, abbreviated_list_str(self.values))
 
     def __repr__(self)->str:
         return self.__str__()
@@ -107,6 +142,17 @@ class AgentCategory:
         """
         self.values.pop(-1)
 
+    def remove_lowest_agents(self, count:int):
+        """
+        Removes the 'count' lowest-valued agents from this category.
+        >>> category = AgentCategory("buyer", [1, 5, 3, 4])
+        >>> category.remove_lowest_agents(2); category.values
+        [5, 4]
+        >>> category.remove_lowest_agents(0); category.values
+        [5, 4]
+        """
+        del self.values[len(self.values)-count:]
+
     def clone(self):
         return AgentCategory(self.name, self.values)
 
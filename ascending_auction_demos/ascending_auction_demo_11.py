@@ -26,6 +26,6 @@ market = Market([
     AgentCategory("seller", [-1, -1, -1, -1, -1]),
 ])
 
-print(budget_balanced_ascending_auction(market, [1,1]))
+print(budget_balanced_ascending_auction(market, [1,1], diagnostics=True))
 
 
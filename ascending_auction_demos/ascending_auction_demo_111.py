@@ -25,7 +25,7 @@ market = Market([
     AgentCategory("buyer",    [17, 14, 13, 9, 6]),
     AgentCategory("seller",   [-1, -4, -5, -8, -11]),
     AgentCategory("mediator", [-1, -3, -4, -7, -10])])
-print(budget_balanced_ascending_auction(market, ps_recipe))
+print(budget_balanced_ascending_auction(market, ps_recipe, diagnostics=True))
 
 
 print("\n\n###### SIMILAR EXAMPLE, WHERE PRICE STOPS BETWEEN SELLERS:")
@@ -33,18 +33,18 @@ market = Market([
     AgentCategory("buyer",    [17, 14, 13, 9, 6]),
     AgentCategory("seller",   [-1, -4, -5, -8, -11]),
     AgentCategory("mediator", [-1, -3, -6, -7, -10])])
-print(budget_balanced_ascending_auction(market, ps_recipe))
+print(budget_balanced_ascending_auction(market, ps_recipe, diagnostics=True))
 
 print("\n\n###### SIMILAR EXAMPLE, WHERE PRICE STOPS BETWEEN MEDIATORS:")
 market = Market([
     AgentCategory("buyer",    [17, 14, 13, 9, 6]),
     AgentCategory("seller",   [-1, -4, -6.5, -8, -11]),
     AgentCategory("mediator", [-1, -3, -6, -7, -10])])
-print(budget_balanced_ascending_auction(market, ps_recipe))
+print(budget_balanced_ascending_auction(market, ps_recipe, diagnostics=True))
 
 print("\n\n###### SIMILAR EXAMPLE, WHERE PRICE STOPS BETWEEN BUYERS:")
 market = Market([
     AgentCategory("buyer",    [17, 14, 13, 9, 6]),
     AgentCategory("seller",   [-1, -4, -7.5, -8, -11]),
     AgentCategory("mediator", [-1, -3, -6, -7, -10])])
-print(budget_balanced_ascending_auction(market, ps_recipe))
+print(budget_balanced_ascending_auction(market, ps_recipe, diagnostics=True))
@@ -26,7 +26,7 @@ market = Market([
     AgentCategory("seller", [-1, -2, -3, -4, -5, -7, -8, -10, -11]),
 ])
 
-print(budget_balanced_ascending_auction(market, [1,2]))
+print(budget_balanced_ascending_auction(market, [1,2], diagnostics=True))
 
 
 print("\n\n###### RUNNING EXAMPLE FROM THE PAPER, WITH DIFFERENT CATEGORY ORDER")
@@ -36,7 +36,7 @@ market = Market([
     AgentCategory("buyer", [17, 14, 13, 9, 6]),
 ])
 
-print(budget_balanced_ascending_auction(market, [2,1]))
+print(budget_balanced_ascending_auction(market, [2,1], diagnostics=True))
 
 
 print("\n\n###### ADDITIONAL EXAMPLES")
@@ -46,34 +46,34 @@ market = Market([
     AgentCategory("seller", [-1, -2, -3, -4, -5, -8, -10, -11]),
     AgentCategory("buyer", [20, 19, 18, 17, 9, 6]),
 ])
-print(budget_balanced_ascending_auction(market, [2,1]))
+print(budget_balanced_ascending_auction(market, [2,1], diagnostics=True))
 
 print("\n\n###### k=3, price-increase stops before second seller")
 market = Market([
     AgentCategory("seller", [-1, -2, -3, -4, -5, -8, -10, -11]),
     AgentCategory("buyer", [17, 15, 14, 11, 9, 6]),
 ])
-print(budget_balanced_ascending_auction(market, [2,1]))
+print(budget_balanced_ascending_auction(market, [2,1], diagnostics=True))
 
 print("\n\n###### k=2!!, price-increase stops before second seller")
 market = Market([
     AgentCategory("seller", [-1, -2, -3, -4, -5, -8, -10, -11]),
     AgentCategory("buyer", [17, 15, 12, 11, 9, 6]),
 ])
-print(budget_balanced_ascending_auction(market, [2,1]))
+print(budget_balanced_ascending_auction(market, [2,1], diagnostics=True))
 
 print("\n\n###### k=3, price-increase stops before buyer")
 market = Market([
     AgentCategory("seller", [-1, -2, -3, -4, -5, -8, -10, -11]),
     AgentCategory("buyer", [17, 15, 14, 9.5, 9, 6]),
 ])
-print(budget_balanced_ascending_auction(market, [2,1]))
+print(budget_balanced_ascending_auction(market, [2,1], diagnostics=True))
 
 print("\n\n###### k=2!!, price-increase stops before buyer")
 market = Market([
     AgentCategory("seller", [-1, -2, -3, -4, -5, -8, -10, -11]),
     AgentCategory("buyer", [17, 15, 12, 9.5, 9, 6]),
 ])
-print(budget_balanced_ascending_auction(market, [2,1]))
+print(budget_balanced_ascending_auction(market, [2,1], diagnostics=True))
 
 
@@ -32,4 +32,4 @@ market = Market([
     AgentCategory("mediator", [-3, -4, -5, -6, -7, -8, -9, -10]),
     AgentCategory("seller",   [-1, -2, -3, -4, -5, -6, -7, -8]),
 ])
-print(budget_balanced_ascending_auction(market, [2,2,3]))
+print(budget_balanced_ascending_auction(market, [2,2,3], diagnostics=True))
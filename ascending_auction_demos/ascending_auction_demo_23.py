@@ -22,10 +22,10 @@ market = Market([
     AgentCategory("seller", [-2., -4., -6., -8., -10., -12., -14.]),
 ])
 
-print(budget_balanced_ascending_auction(market, [2,3]))
+print(budget_balanced_ascending_auction(market, [2,3], diagnostics=True))
     # Here, k=1, and the final trade involves 2 buyers and 5 sellers
     # (so 3 sellers should be selected at random).
 
-print(budget_balanced_ascending_auction(market, [3,2]))
+print(budget_balanced_ascending_auction(market, [3,2], diagnostics=True))
     # Here, k=1, and the final trade involves 5 buyers and 3 sellers
     #  (so 3 buyers and 2 sellers should be selected at random).
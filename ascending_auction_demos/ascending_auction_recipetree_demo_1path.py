@@ -29,7 +29,7 @@ market = Market([
     AgentCategory("buyer",    [9, 7, 5]),
     AgentCategory("seller", [-2, -4, -6]),
 ])
-print(budget_balanced_ascending_auction(market, recipes_11))
+print(budget_balanced_ascending_auction(market, recipes_11, diagnostics=True))
 
 # print("\n\n###### TEST MULTI RECIPE AUCTION WITH A SINGLE PATH: [1,1,1]")
 # market = Market([
@@ -48,7 +48,7 @@ market = Market([
     AgentCategory("producerA", [-1, -3, -5]),
     AgentCategory("producerB", [-1, -4, -6]),
 ])
-print(budget_balanced_ascending_auction(market, recipes_1100_1011))
+print(budget_balanced_ascending_auction(market, recipes_1100_1011, diagnostics=True))
 #
 #
 # print("\n\n###### TEST TWO DIFFERENT RECIPES - RICA'S EXAMPLE")
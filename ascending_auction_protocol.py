@@ -2,6 +2,7 @@
 
 """
 function budget_balanced_ascending_auction
+class AscendingAuctionState - the same auction, run step by step.
 Implementation of a multiple-clock strongly-budget-balanced ascending auction for a multi-lateral market.
 
 Author: Erel Segal-Halevi
@@ -12,21 +13,41 @@ from agents import AgentCategory, EmptyCategoryException, MAX_VALUE
 from markets import Market
 from trade import TradeWithSinglePrice
 import prices
-from prices import AscendingPriceVector, PriceStatus
+from prices import AscendingPriceVector, PriceStatus, FixedPointScale, PriceTrajectoryRecorder
+from auction_state import AuctionState, AuctionEvent
 
-import math, logging, sys
+import math, heapq, logging, sys
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler(sys.stdout))
 # To enable tracing, set logger.setLevel(logging.INFO)
 
 
-def budget_balanced_ascending_auction(market:Market, ps_recipe: list, max_iterations=999999999)->TradeWithSinglePrice:
+def budget_balanced_ascending_auction(market:Market, ps_recipe: list, max_iterations=999999999, price_resolution:int=None, price_tick:float=None,
+                                      engine:str="rounds", cross_check:bool=False, diagnostics:bool=False,
+                                      recorder:PriceTrajectoryRecorder=None)->TradeWithSinglePrice:
     """
     Calculate the trade and prices using generalized-ascending-auction.
     :param market:   contains a list of k categories, each containing several agents.
     :param ps_recipe:  a list of integers, one integer per category.
                        Each integer i represents the number of agents of category i
                        that should be in each procurement-set.
+    :param price_resolution: if given, prices are computed exactly in integer fixed-point units
+                       (see prices.FixedPointScale); e.g. 100 when all values are in cents.
+    :param price_tick: if given, the prices rise like a discrete clock, by whole ticks of the price-sum;
+                       the auction stops at the first tick where the price-sum is non-negative.
+    :param engine:     "rounds" (default) simulates the auction round by round, removing one agent per round.
+                       "events" computes the final sizes and prices directly, by binary search over the stopping round;
+                       its running time does not depend on the number of agents. It does not support price_tick.
+                       With price_resolution, its outcome is identical to that of the rounds engine.
+                       With floats, the prices may differ by rounding errors, and so may the sizes when
+                       the price-sum reaches zero at an agent's value (up to rounding).
+    :param cross_check: if True, both engines are run, and a ValueError is raised if their outcomes differ
+                       (exactly with price_resolution, or beyond the rounding errors with floats; see _verify_identical_outcomes).
+    :param diagnostics: if True, the optimal trade is computed too (using max_iterations), logged for comparison,
+                       and attached to the returned trade as trade.optimal_trade.
+                       If False (default), it is not computed at all.
+    :param recorder:   if given, every price change is recorded in it (see prices.PriceTrajectoryRecorder).
+                       Supported only by the rounds engine.
     :return: Trade object, representing the trade and prices.
 
     >>> # ONE BUYER, ONE SELLER
@@ -88,6 +109,35 @@ def budget_balanced_ascending_auction(market:Market, ps_recipe: list, max_iterat
     seller: [-4.0]: all 1 agents trade and pay -8.0
     buyer: [9.0]: all 1 agents trade and pay 8.0
 
+    >>> # EXACT PRICES ON A GRID OF 0.1
+    >>> # In floats, the mediator price is 0.6-0.8, which is not exactly -0.2, since 0.6 and 0.8 have no exact binary representation:
+    >>> market = Market([AgentCategory("buyer", [0.8, 0.1]), AgentCategory("mediator", [0.0, -0.3]), AgentCategory("seller", [-0.5, -0.6])])
+    >>> budget_balanced_ascending_auction(market, [1,1,1]).prices
+    [0.8, -0.20000000000000007, -0.6]
+    >>> budget_balanced_ascending_auction(market, [1,1,1], price_resolution=10).prices
+    [0.8, -0.2, -0.6]
+
+    >>> # A DISCRETE CLOCK WITH TICKS OF 0.25
+    >>> budget_balanced_ascending_auction(market, [1,1,1], price_resolution=100, price_tick=0.25).prices
+    [0.75, -0.25, -0.5]
+
+    >>> # THE EVENT-JUMPING ENGINE
+    >>> market = Market([AgentCategory("buyer", [9., 8., 7., 6.]),  AgentCategory("seller", [-6., -5., -4.,-3.,-2.,-1.])])
+    >>> print(budget_balanced_ascending_auction(market, [1,2], engine="events", cross_check=True))
+    buyer: [9.0]: all 1 agents trade and pay 8.0
+    seller: [-1.0, -2.0, -3.0, -4.0]: random 2 out of 4 agents trade and pay -4.0
+
+    >>> # RECORDING THE PRICE TRAJECTORY
+    >>> recorder = PriceTrajectoryRecorder()
+    >>> trade = budget_balanced_ascending_auction(market, [1,2], recorder=recorder)
+    >>> recorder.rows[["round", "category", "new_price", "status", "size"]].tolist()
+    [(1, 0, 6.0, 1, 3), (2, 0, 7.0, 1, 2), (3, 1, -6.0, 1, 5), (4, 1, -5.0, 1, 4), (5, 0, 8.0, 1, 1), (6, 1, -4.0, 2, 4)]
+
+    >>> # DIAGNOSTICS: THE OPTIMAL TRADE IS ATTACHED FOR COMPARISON
+    >>> budget_balanced_ascending_auction(market, [1,2]).optimal_trade is None
+    True
+    >>> budget_balanced_ascending_auction(market, [1,2], diagnostics=True).optimal_trade
+    2 deals: [(8.0, -3.0, -4.0), (9.0, -1.0, -2.0)]
     """
     num_categories = market.num_categories
     if len(ps_recipe) != num_categories:
@@ -95,44 +145,278 @@ def budget_balanced_ascending_auction(market:Market, ps_recipe: list, max_iterat
             "There are {} categories but {} elements in the PS recipe".
                 format(num_categories, len(ps_recipe)))
 
-    relevant_category_indices = [i for i in range(num_categories) if ps_recipe[i]>0]
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine {}; the possible engines are {}".format(engine, list(ENGINES)))
+    if price_tick is not None and (engine=="events" or cross_check):
+        raise ValueError("The events engine does not support price_tick")
+    if recorder is not None and engine=="events":
+        raise ValueError("The events engine does not support recorder")
 
     logger.info("\n#### Budget-Balanced Ascending Auction\n")
     logger.info(market)
-    logger.info("Procurement-set recipe: {}".format(ps_recipe))
+    logger.info("Procurement-set recipe: %s", ps_recipe)
 
-    optimal_trade = market.optimal_trade(ps_recipe, max_iterations=max_iterations)[0]
-    logger.info("For comparison, the optimal trade is: %s\n", optimal_trade)
+    if diagnostics:
+        optimal_trade = market.optimal_trade(ps_recipe, max_iterations=max_iterations)[0]
+        logger.info("For comparison, the optimal trade is: %s\n", optimal_trade)
 
-    remaining_market = market.clone()
-    prices = AscendingPriceVector(ps_recipe, -MAX_VALUE)
+    trade = ENGINES[engine](market, ps_recipe, price_resolution, price_tick, recorder)
+    if cross_check:
+        other_engine = "events" if engine=="rounds" else "rounds"
+        other_trade = ENGINES[other_engine](market, ps_recipe, price_resolution, price_tick, None)
+        _verify_identical_outcomes(trade, other_trade, exact=price_resolution is not None)
+    if diagnostics:
+        trade.optimal_trade = optimal_trade
+    return trade
+
+
+class CategoryQueue:
+    """
+    A priority queue of the relevant categories of a PS recipe (with a positive count),
+    keyed by their fractional potential-PS count (largest first).
+    Ties are broken by the category index (first index wins), as in max(relevant_category_indices, key=fractional_potential_ps).
+    In each round of the auction only the main category changes, so it is the only one whose key should be updated.
+
+    >>> queue = CategoryQueue([1, 2, 0], [3, 6, 5])
+    >>> queue.main_category_index()
+    0
+    >>> queue.update_main_category(2); queue.main_category_index()
+    1
+    """
+
+    def __init__(self, ps_recipe:list, category_sizes:list):
+        self.ps_recipe = ps_recipe
+        self.heap = [(-size/ps_recipe[i], i) for (i, size) in enumerate(category_sizes) if ps_recipe[i]>0]
+        heapq.heapify(self.heap)
+
+    def main_category_index(self)->int:
+        """
+        :return: the index of a category with a largest number of potential PS.
+        """
+        return self.heap[0][1]
+
+    def update_main_category(self, new_size:int):
+        """
+        Update the key of the main category after its size changed to new_size.
+        """
+        main_category_index = self.heap[0][1]
+        heapq.heapreplace(self.heap, (-new_size/self.ps_recipe[main_category_index], main_category_index))
+
+
+class AscendingAuctionState(AuctionState):
+    """
+    The state of a single-recipe ascending auction, that can be run step by step (see auction_state.AuctionState).
+    Each step chooses a category with a largest number of potential PS, increases its price,
+    and removes its lowest agent (unless the price-sum crosses zero or the category is empty).
+
+    >>> market = Market([AgentCategory("buyer", [9.,8.,7.,6.]),  AgentCategory("seller", [-1.,-2.,-3.,-4.,-5.,-6.,-7.])])
+    >>> state = AscendingAuctionState(market, [1,1])
+    >>> state.step()
+    <AuctionEvent.AGENT_REMOVED: 1>
+    >>> print(state.remaining_market); print(state.prices)
+    Traders: [buyer: [9.0, 8.0, 7.0, 6.0], seller: [-1.0, -2.0, -3.0, -4.0, -5.0, -6.0]]
+    [-1000000, -7.0]
+    >>> saved = state.checkpoint()
+    >>> state.run_until(AuctionEvent.PRICE_CROSSED_ZERO), state.done, state.num_of_steps
+    (<AuctionEvent.PRICE_CROSSED_ZERO: 2>, True, 4)
+    >>> print(state.trade())
+    buyer: [9.0, 8.0, 7.0, 6.0]: all 4 agents trade and pay 5.0
+    seller: [-1.0, -2.0, -3.0, -4.0]: all 4 agents trade and pay -5.0
+    >>> # The checkpoint is not affected by running the original state:
+    >>> saved.done, saved.run_until(max_steps=2), saved.done, saved.num_of_steps
+    (False, <AuctionEvent.AGENT_REMOVED: 1>, False, 3)
+    >>> print(saved.run())
+    buyer: [9.0, 8.0, 7.0, 6.0]: all 4 agents trade and pay 5.0
+    seller: [-1.0, -2.0, -3.0, -4.0]: all 4 agents trade and pay -5.0
+    """
 
-    # Functions for calculating the number of potential PS that can be supported by a category:
-    fractional_potential_ps = lambda category_index: remaining_market.categories[category_index].size() / ps_recipe[category_index]
-    integral_potential_ps   = lambda category_index: math.floor(remaining_market.categories[category_index].size() / ps_recipe[category_index])
+    def __init__(self, market:Market, ps_recipe:list, price_resolution:int=None, price_tick:float=None, initial_price=-MAX_VALUE,
+                 recorder:PriceTrajectoryRecorder=None):
+        """
+        :param market, ps_recipe, price_resolution, price_tick, recorder: see budget_balanced_ascending_auction.
+        :param initial_price: the initial price of each category (a number or a list); default is -MAX_VALUE.
+                              The initial price-sum must be negative.
+        """
+        super().__init__()
+        self.ps_recipe = ps_recipe
+        self.recorder = recorder
+        self.remaining_market = market.clone()
+        scale = None if price_resolution is None else FixedPointScale(price_resolution, [ps_recipe])
+        if isinstance(initial_price, list):
+            initial_price = list(initial_price)   # the price vector modifies its list in place
+        self.prices = AscendingPriceVector(ps_recipe, initial_price, scale=scale, tick=price_tick)
+
+        self.category_queue = CategoryQueue(ps_recipe, [category.size() for category in self.remaining_market.categories])
+
+    def fractional_potential_ps(self, category_index:int)->float:
+        """
+        :return: the number of potential PS that can be supported by the given category.
+        """
+        return self.remaining_market.categories[category_index].size() / self.ps_recipe[category_index]
+
+    def _step(self)->AuctionEvent:
+        remaining_market, prices = self.remaining_market, self.prices
 
-    while True:
         # find a category with a largest number of potential PS, and increase its price
-        main_category_index = max(relevant_category_indices, key=fractional_potential_ps)
+        main_category_index = self.category_queue.main_category_index()
         main_category = remaining_market.categories[main_category_index]
-        logger.info("Chosen category: {} with {} agents and ratio {}".format(main_category.name, main_category.size(), fractional_potential_ps(main_category_index)))
+        logger.info("Chosen category: %s with %d agents and ratio %s", main_category.name, main_category.size(), self.fractional_potential_ps(main_category_index))
 
         if main_category.size() == 0:
             logger.info("\nThe %s category became empty - no trade!", main_category.name)
             logger.info("  Final price-per-unit vector: %s", prices)
-            break
+            self._finish()
+            return AuctionEvent.NO_TRADE
 
+        old_price = prices[main_category_index]
         prices.increase_price_up_to_balance(main_category_index, main_category.lowest_agent_value(), main_category.name)
         if prices.status == PriceStatus.STOPPED_AT_ZERO_SUM:
+            if self.recorder is not None:
+                self.recorder.record(self.num_of_steps+1, main_category_index, old_price, prices[main_category_index], prices.status, main_category.size())
             logger.info("\nPrice crossed zero.")
             logger.info("  Final price-per-unit vector: %s", prices)
-            break
+            self._finish()
+            return AuctionEvent.PRICE_CROSSED_ZERO
 
         main_category.remove_lowest_agent()
-        logger.info("  {} price increases to {}: {} agents and ratio {}".format(main_category.name, prices[main_category_index], main_category.size(), fractional_potential_ps(main_category_index)))
+        new_size = main_category.size()
+        if self.recorder is not None:
+            self.recorder.record(self.num_of_steps+1, main_category_index, old_price, prices.prices[main_category_index], prices.status, new_size)
+        self.category_queue.update_main_category(new_size)
+        logger.info("  %s price increases to %s: %d agents and ratio %s", main_category.name, prices[main_category_index], main_category.size(), self.fractional_potential_ps(main_category_index))
+        return AuctionEvent.AGENT_REMOVED
 
+    def _finish(self):
+        logger.info(self.remaining_market)
+        self.final_trade = TradeWithSinglePrice(self.remaining_market.categories, self.ps_recipe, self.prices.prices)
+
+
+def _ascending_auction_rounds(market:Market, ps_recipe:list, price_resolution:int, price_tick:float, recorder:PriceTrajectoryRecorder)->TradeWithSinglePrice:
+    """
+    The round-by-round engine of budget_balanced_ascending_auction: each round removes a single agent.
+    """
+    return AscendingAuctionState(market, ps_recipe, price_resolution=price_resolution, price_tick=price_tick, recorder=recorder).run()
+
+
+def _ascending_auction_events(market:Market, ps_recipe:list, price_resolution:int, price_tick:float=None, recorder:PriceTrajectoryRecorder=None)->TradeWithSinglePrice:
+    """
+    The event-jumping engine of budget_balanced_ascending_auction.
+
+    In the rounds engine, each round removes the lowest agent of a category with a largest ratio size/r_i
+    (the first such category on ties). Since the ratios only decrease, the removals happen
+    in descending order of s/r_i, where s is the size of category i just before the removal, with ties broken by index.
+    The ratios are compared exactly using the integer keys s*(L/r_i), where L is the LCM of the counts.
+
+    The price-sum after each removal is non-decreasing, so the round in which it reaches zero is found by
+    a binary search over the keys, followed by a scan of the (at most one per category) removals with the stopping key.
+    The running time is O(categories * log(max size)).
+    """
+    relevant_category_indices = [i for i in range(market.num_categories) if ps_recipe[i]>0]
+    scale = None if price_resolution is None else FixedPointScale(price_resolution, [ps_recipe])
+    categories = market.categories
+    initial_sizes = [category.size() for category in categories]
+    lcm_of_counts = math.lcm(*[ps_recipe[i] for i in relevant_category_indices])
+    key_multipliers = {i: lcm_of_counts // ps_recipe[i] for i in relevant_category_indices}
+
+    # All the arithmetic is done in integer units in fixed-point mode, and in floats otherwise:
+    to_units = (lambda price: price) if scale is None else scale.to_units
+    to_price = (lambda units: units) if scale is None else scale.to_price
+    # In floats, the sum is correctly rounded, so the rounding error of the initial prices (-MAX_VALUE) does not remain in it:
+    summation = math.fsum if scale is None else sum
+    initial_units = to_units(-MAX_VALUE)
+
+    def units_after_removals(i:int, num_of_removals:int):
+        # the price of category i is the value of its latest removed agent.
+        return initial_units if num_of_removals==0 else to_units(categories[i].values[initial_sizes[i]-num_of_removals])
+
+    def removals_before_key(key:int)->dict:
+        # the number of agents removed from each category, before the first removal with key <= the given key.
+        return {i: max(0, initial_sizes[i] - key // key_multipliers[i]) for i in relevant_category_indices}
+
+    def price_sum(num_of_removals:dict):
+        return summation(ps_recipe[i]*units_after_removals(i, num_of_removals[i]) for i in relevant_category_indices)
+
+    max_key = max([initial_sizes[i]*key_multipliers[i] for i in relevant_category_indices])
+    if price_sum(removals_before_key(0)) < 0:
+        # The price-sum is negative even after all agents are removed - no trade.
+        num_of_removals = removals_before_key(0)
+        final_units = {i: units_after_removals(i, num_of_removals[i]) for i in relevant_category_indices}
+        logger.info("\nAll categories became empty - no trade!")
+    else:
+        # Binary search for the smallest key at which the price-sum, after all removals with larger keys, is negative.
+        low, high = 0, max_key     # invariant: price_sum at low is non-negative, at high is negative.
+        while high - low > 1:
+            middle = (low + high) // 2
+            if price_sum(removals_before_key(middle)) >= 0:
+                low = middle
+            else:
+                high = middle
+        stopping_key = high
+        num_of_removals = removals_before_key(stopping_key)
+        final_units = {i: units_after_removals(i, num_of_removals[i]) for i in relevant_category_indices}
+        current_sum = price_sum(num_of_removals)
+        # Scan the removals with the stopping key, in order of category index, until the price-sum reaches zero:
+        for i in relevant_category_indices:
+            size, remainder = divmod(stopping_key, key_multipliers[i])
+            if remainder != 0 or not 1 <= size <= initial_sizes[i]:
+                continue
+            sum_without_category = current_sum - ps_recipe[i]*final_units[i]
+            new_units = to_units(categories[i].values[size-1])
+            if sum_without_category + ps_recipe[i]*new_units >= 0:
+                if scale is None:
+                    final_units[i] = -sum_without_category / ps_recipe[i]
+                else:
+                    final_units[i] = -sum_without_category // ps_recipe[i]
+                logger.info("\nPrice crossed zero while increasing the price of %s.", categories[i].name)
+                break
+            num_of_removals[i] += 1
+            final_units[i] = new_units
+            current_sum = sum_without_category + ps_recipe[i]*new_units
+
+    remaining_market = market.clone()
+    prices = [to_price(initial_units)] * market.num_categories
+    for i in relevant_category_indices:
+        remaining_market.categories[i].remove_lowest_agents(num_of_removals[i])
+        prices[i] = to_price(final_units[i])
+    logger.info("  Final price-per-unit vector: %s", prices)
     logger.info(remaining_market)
-    return TradeWithSinglePrice(remaining_market.categories, ps_recipe, prices.prices)
+    return TradeWithSinglePrice(remaining_market.categories, ps_recipe, prices)
+
+
+ENGINES = {"rounds": _ascending_auction_rounds, "events": _ascending_auction_events}
+
+
+def _verify_identical_outcomes(trade:TradeWithSinglePrice, other_trade:TradeWithSinglePrice, exact:bool):
+    """
+    Raise a ValueError if the outcomes of the two engines differ.
+    :param exact: True in fixed-point mode: the category sizes and the prices must be identical.
+                  False in float mode: the prices are compared with a tolerance, and the sizes may differ only by agents
+                  whose value equals the price up to the tolerance. Such an agent is indifferent between trading and not,
+                  and whether an engine removes it before the price-sum reaches zero depends on its rounding errors.
+
+    >>> trade = TradeWithSinglePrice([AgentCategory("buyer", [5.]), AgentCategory("seller", [-3., -4.])], [1,1], [4., -4.])
+    >>> other_trade = TradeWithSinglePrice([AgentCategory("buyer", [5.]), AgentCategory("seller", [-3.])], [1,1], [4., -3.9999999999999996])
+    >>> _verify_identical_outcomes(trade, other_trade, exact=False)
+    >>> _verify_identical_outcomes(trade, other_trade, exact=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: The engines disagree on the final category sizes: [1, 2] vs [1, 1]
+    """
+    sizes = [category.size() for category in trade.categories]
+    other_sizes = [category.size() for category in other_trade.categories]
+    if exact:
+        if sizes != other_sizes:
+            raise ValueError("The engines disagree on the final category sizes: {} vs {}".format(sizes, other_sizes))
+        if trade.prices != other_trade.prices:
+            raise ValueError("The engines disagree on the final prices: {} vs {}".format(trade.prices, other_trade.prices))
+        return
+    for (price, other_price) in zip(trade.prices, other_trade.prices):
+        if not math.isclose(price, other_price, rel_tol=1e-9, abs_tol=1e-9):
+            raise ValueError("The engines disagree on the final prices: {} vs {}".format(trade.prices, other_trade.prices))
+    for (category, other_category, price) in zip(trade.categories, other_trade.categories, trade.prices):
+        (smaller, larger) = sorted([category, other_category], key=lambda c: c.size())
+        if any(not math.isclose(value, price, rel_tol=1e-9, abs_tol=1e-9) for value in larger.values[smaller.size():]):
+            raise ValueError("The engines disagree on the final category sizes: {} vs {}".format(sizes, other_sizes))
 
 
 
@@ -78,4 +78,4 @@ recipes_4paths = [0, [1, [2, None, 3, None], 4, [5, None, 6, None]]]
 #     1,0,0,0,1,1,0   [C0, C4, C5]
 #     1,0,0,0,1,0,1   [C0, C4, C6]
 
-print(budget_balanced_ascending_auction(market, recipes_4paths))
+print(budget_balanced_ascending_auction(market, recipes_4paths, diagnostics=True))
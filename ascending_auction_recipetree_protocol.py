@@ -2,6 +2,7 @@
 
 """
 function budget_balanced_ascending_auction
+class AscendingAuctionState - the same auction, run step by step.
 Implementation of a multiple-clock strongly-budget-balanced ascending auction for a multi-lateral market.
 
 Allows multiple recipes, but only of the following kind:
@@ -23,10 +24,11 @@ Since:  2020-03
 
 from agents import AgentCategory, EmptyCategoryException, MAX_VALUE
 from markets import Market
-from trade import Trade, TradeWithSinglePrice
-from prices import SimultaneousAscendingPriceVectors, PriceStatus
+from trade import Trade, TradeWithSinglePrice, TradeWithMaterialBalance
+from prices import SimultaneousAscendingPriceVectors, PriceStatus, PriceTrajectoryRecorder
 from typing import *
 from recipetree import RecipeTree
+from auction_state import AuctionState, AuctionEvent
 
 import logging, sys, math
 logger = logging.getLogger(__name__)
@@ -46,7 +48,9 @@ class TradeWithMultipleRecipes(Trade):
         self.num_categories = len(categories)
         self.recipe_tree = recipe_tree
         self.prices = prices
-        (self.num_of_deals_cache, self.num_of_deals_explanation_cache) = recipe_tree.num_of_deals_explained(prices)
+        self.num_of_deals_per_node = recipe_tree.num_of_deals_per_node()
+        self.num_of_deals_cache = self.num_of_deals_per_node[0]
+        self.num_of_deals_explanation_cache = None   # rendered on demand by __repr__
         self.gft_cache = recipe_tree.optimal_trade_GFT()
 
     def num_of_deals(self):
@@ -58,11 +62,14 @@ class TradeWithMultipleRecipes(Trade):
     def __repr__(self):
         if self.num_of_deals_cache==0:
             return "No trade"
+        if self.num_of_deals_explanation_cache is None:
+            self.num_of_deals_explanation_cache = self.recipe_tree.explain_num_of_deals(self.num_of_deals_per_node, self.prices)
         return self.num_of_deals_explanation_cache.rstrip()
 
 
 def budget_balanced_ascending_auction(
-        market:Market, ps_recipe_struct: List[Any])->TradeWithMultipleRecipes:
+        market:Market, ps_recipe_struct: List[Any], price_resolution:int=None, price_tick:float=None, diagnostics:bool=False,
+        recorder:PriceTrajectoryRecorder=None)->TradeWithMultipleRecipes:
     """
     Calculate the trade and prices using generalized-ascending-auction.
     Allows multiple recipes, but they must be represented by a *recipe tree*.
@@ -72,6 +79,14 @@ def budget_balanced_ascending_auction(
                              The nested list represents a tree, where each path from root to leaf represents a recipe.
                              For example: [0, [1, None]] is a single recipe with categories {0,1}.
                                     [0, [1, None, 2, None]] is two recipes with categories {0,1} and {0,2}.
+                             Can also be a recipetree.RecipeStructure.
+    :param price_resolution: if given, prices are computed exactly in integer fixed-point units
+                             (see prices.FixedPointScale); e.g. 100 when all values are in cents.
+    :param price_tick:       if given, the prices rise like a discrete clock, by whole ticks of the price-sum;
+                             the auction stops at the first tick where the price-sum is non-negative.
+    :param diagnostics:      if True, the optimal trade is computed too, logged for comparison,
+                             and attached to the returned trade as trade.optimal_trade.
+    :param recorder:         if given, every price change is recorded in it (see prices.PriceTrajectoryRecorder).
 
     :return: Trade object, representing the trade and prices.
 
@@ -106,26 +121,74 @@ def budget_balanced_ascending_auction(
     buyer: 1 out of 2 traders selected, price=4.0
     seller: all 1 traders selected
     1 deals overall
+
+    >>> budget_balanced_ascending_auction(market, recipe_11, diagnostics=True).optimal_trade
+    2 deals: [(9.0, -3.0), (8.0, -4.0)]
+
+    >>> recorder = PriceTrajectoryRecorder()
+    >>> trade = budget_balanced_ascending_auction(market, recipe_11, recorder=recorder)
+    >>> recorder.rows[["round", "category", "old_price", "new_price", "size"]].tolist()
+    [(1, 1, -1000000.0, -4.0, 1), (2, 0, -1000000.0, 4.0, 2)]
     """
     logger.info("\n#### Multi-Recipe Budget-Balanced Ascending Auction\n")
     logger.info(market)
-    logger.info("Procurement-set recipe struct: {}".format(ps_recipe_struct))
+    logger.info("Procurement-set recipe struct: %s", ps_recipe_struct)
 
-    remaining_market = market.clone()
-    recipe_tree = RecipeTree(remaining_market.categories, ps_recipe_struct)
-    logger.info("Tree of recipes: {}".format(recipe_tree.paths_to_leaf()))
-    ps_recipes = recipe_tree.recipes()
-    logger.info("Procurement-set recipes: {}".format(ps_recipes))
+    state = AscendingAuctionState(market, ps_recipe_struct, price_resolution=price_resolution, price_tick=price_tick, recorder=recorder)
+    if diagnostics:
+        optimal_trade, optimal_count, optimal_GFT = state.recipe_tree.optimal_trade()
+        logger.info("For comparison, the optimal trade has k=%d, GFT=%f: %s\n", optimal_count,optimal_GFT,optimal_trade)
+        optimal_trade = TradeWithMaterialBalance(optimal_trade)
+    trade = state.run()
+    if diagnostics:
+        trade.optimal_trade = optimal_trade
+    return trade
 
 
-    optimal_trade, optimal_count, optimal_GFT = recipe_tree.optimal_trade()
-    logger.info("For comparison, the optimal trade has k=%d, GFT=%f: %s\n", optimal_count,optimal_GFT,optimal_trade)
-    # optimal_trade = market.optimal_trade(ps_recipe)[0]
+class AscendingAuctionState(AuctionState):
+    """
+    The state of a recipe-tree ascending auction, that can be run step by step (see auction_state.AuctionState).
+    Each step simultaneously increases the prices of the largest categories (one in each path of the recipe tree),
+    and removes the agents who do not want to trade in the new prices (unless the price-sum crosses zero).
 
-    #### STOPPED HERE
+    >>> market = Market([AgentCategory("buyer", [9.,8.]),  AgentCategory("seller", [-4.,-3.])])
+    >>> state = AscendingAuctionState(market, [0, [1, None]])
+    >>> state.step(), state.done
+    (<AuctionEvent.AGENT_REMOVED: 1>, False)
+    >>> print(state.remaining_market)
+    Traders: [buyer: [9.0, 8.0], seller: [-3.0]]
+    >>> state.run_until(max_steps=10), state.done, state.num_of_steps
+    (<AuctionEvent.PRICE_CROSSED_ZERO: 2>, True, 2)
+    >>> print(state.trade())
+    seller: 1 potential deals, price=-4.0
+    buyer: 1 out of 2 traders selected, price=4.0
+    seller: all 1 traders selected
+    1 deals overall
+    """
 
-    prices = SimultaneousAscendingPriceVectors(ps_recipes, -MAX_VALUE)
-    while True:
+    def __init__(self, market:Market, ps_recipe_struct: List[Any], price_resolution:int=None, price_tick:float=None,
+                 recorder:PriceTrajectoryRecorder=None):
+        """
+        :param market, ps_recipe_struct, price_resolution, price_tick, recorder: see budget_balanced_ascending_auction.
+        """
+        super().__init__()
+        self.recorder = recorder
+        self.remaining_market = market.clone()
+        self.recipe_tree = RecipeTree(self.remaining_market.categories, ps_recipe_struct, memoize=True)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Tree of recipes: %s", self.recipe_tree.paths_to_leaf())
+        ps_recipes = self.recipe_tree.recipes()
+        logger.info("Procurement-set recipes: %s", ps_recipes)
+
+        structure = self.recipe_tree.structure   # shared by all auctions with the same ps_recipe_struct, so its derived data is cached.
+        initial_prices = structure.initial_prices(market.num_categories, -MAX_VALUE)
+        # Each round increases the prices of one category in each path (see RecipeTree.largest_categories),
+        # so there is exactly one increase per recipe, and it is enough to verify it in the first round.
+        self.prices = SimultaneousAscendingPriceVectors(ps_recipes, -MAX_VALUE, initial_prices=initial_prices, resolution=price_resolution, tick=price_tick,
+                                                        always_validate=False, recipes_of_category=structure.recipes_of_category(market.num_categories))
+
+    def _step(self)->AuctionEvent:
+        remaining_market, recipe_tree, prices = self.remaining_market, self.recipe_tree, self.prices
         largest_category_size, combined_category_size, indices_of_prices_to_increase = recipe_tree.largest_categories(indices=True)
         logger.info("\n")
         logger.info(remaining_market)
@@ -135,7 +198,8 @@ def budget_balanced_ascending_auction(
             logger.info("\nCombined category size is 0 - no trade!")
             logger.info("  Final price-per-unit vector: %s", prices)
             logger.info(remaining_market)
-            return TradeWithMultipleRecipes(remaining_market.categories, recipe_tree, prices.map_category_index_to_price())
+            self.final_trade = TradeWithMultipleRecipes(remaining_market.categories, recipe_tree, prices.map_category_index_to_price())
+            return AuctionEvent.NO_TRADE
 
         increases = []
         for category_index in indices_of_prices_to_increase:
@@ -144,22 +208,45 @@ def budget_balanced_ascending_auction(
             increases.append((category_index, target_price, category.name))
 
         logger.info("Planned price-increases: %s", increases)
+        recorded_indices = old_prices = None
+        if self.recorder is not None:
+            recorded_indices = list(dict.fromkeys(indices_of_prices_to_increase))   # each category once, in order
+            current_prices = prices.map_category_index_to_price()
+            old_prices = [current_prices[category_index] for category_index in recorded_indices]
         prices.increase_prices(increases)
         map_category_index_to_price = prices.map_category_index_to_price()
 
         if prices.status == PriceStatus.STOPPED_AT_ZERO_SUM:
+            self._record(recorded_indices, old_prices, map_category_index_to_price)
             logger.info("\nPrice crossed zero.")
             logger.info("  Final price-per-unit vector: %s", map_category_index_to_price)
             logger.info(remaining_market)
-            return TradeWithMultipleRecipes(remaining_market.categories, recipe_tree, map_category_index_to_price)
+            self.final_trade = TradeWithMultipleRecipes(remaining_market.categories, recipe_tree, map_category_index_to_price)
+            return AuctionEvent.PRICE_CROSSED_ZERO
 
-        for category_index in range(market.num_categories):
+        for category_index in range(remaining_market.num_categories):
             category = remaining_market.categories[category_index]
             if map_category_index_to_price[category_index] is not None \
                 and category.size()>0 \
                 and category.lowest_agent_value() <= map_category_index_to_price[category_index]:
                     category.remove_lowest_agent()
-                    logger.info("{} after: {} agents remain".format(category.name, category.size()))
+                    recipe_tree.category_changed(category_index)
+                    logger.info("%s after: %d agents remain", category.name, category.size())
+        self._record(recorded_indices, old_prices, map_category_index_to_price)
+        return AuctionEvent.AGENT_REMOVED
+
+    def _record(self, category_indices:list, old_prices:list, new_prices:list):
+        """
+        Record the price-increases of the current round in the recorder (if any), as a single batch.
+        :param category_indices, old_prices: the categories whose prices increased, and their prices before the round.
+        :param new_prices: the price of every category after the round.
+        """
+        if self.recorder is None:
+            return
+        categories = self.remaining_market.categories
+        self.recorder.record_round(self.num_of_steps+1, self.prices.status, category_indices, old_prices,
+            [new_prices[category_index] for category_index in category_indices],
+            [categories[category_index].size() for category_index in category_indices])
 
 
 
@@ -1,7 +1,8 @@
 #!python3
 
 """
-function budget_balanced_ascending_auction
+function budget_balanced_ascending_auction_twolevels
+class AscendingAuctionState - the same auction, run step by step.
 Implementation of a multiple-clock strongly-budget-balanced ascending auction for a multi-lateral market.
 
 Allows multiple recipes, but only of the following kind:
@@ -24,9 +25,11 @@ Since:  2020-03
 from agents import AgentCategory, EmptyCategoryException, MAX_VALUE
 from markets import Market
 from trade import Trade, TradeWithSinglePrice
-from prices import SimultaneousAscendingPriceVectors, PriceStatus
+from prices import SimultaneousAscendingPriceVectors, PriceStatus, PriceTrajectoryRecorder, calculate_initial_prices_for_recipe_tree
+from recipetree import RecipeTree
 from typing import *
 from math import ceil,floor
+from auction_state import AuctionState, AuctionEvent
 
 import logging, sys
 logger = logging.getLogger(__name__)
@@ -40,18 +43,33 @@ class TradeWithMultipleRecipes(Trade):
     """
     Represents the outcome of budget_balanced_ascending_auction_twolevels.
     See there for details.
+    The deals and the gain-from-trade are computed on a two-level RecipeTree,
+    in which each category g contributes groups of r_g agents.
+
+    >>> categories = [AgentCategory("buyer", [9., 8., 7.]), AgentCategory("seller", [-1., -2., -3., -4., -5.]), AgentCategory("producer", [-6.])]
+    >>> trade = TradeWithMultipleRecipes(categories, [1, 2, 1], [6., -3., -6.])
+    >>> trade.num_of_deals(), trade.gain_from_trade()
+    (3, 8.0)
+    >>> print(trade)
+    seller: 2 potential deals, price=-3.0
+    producer: 1 potential deals, price=-6.0
+    buyer: all 3 traders selected, price=6.0
+    seller + producer: all 3 traders selected
+    3 deals overall
     """
     def __init__(self, categories:List[AgentCategory], ps_recipe_counts, prices:List[float]):
         self.categories = categories
-        category_sizes = [len(category) for category in categories]
-        supported_PS = [floor(category_size/count) for category_size,count in zip(category_sizes,ps_recipe_counts)]
         self.num_categories = len(categories)
         self.prices = prices
         self.ps_recipe_counts = ps_recipe_counts
-        self.num_of_deals_cache = None
-        self.num_of_deals_explanation_cache = \
-            f"Final traders: {categories}\nFinal prices: {prices}\nFinal category sizes: {category_sizes}\nSupported PSs: {supported_PS}"
-        self.gft_cache = None
+        children = []
+        for child_index in range(1, self.num_categories):
+            children += [child_index, None]
+        self.recipe_tree = RecipeTree(categories, [0, children or None], required_counts=ps_recipe_counts)
+        self.num_of_deals_per_node = self.recipe_tree.num_of_deals_per_node()
+        self.num_of_deals_cache = self.num_of_deals_per_node[0]
+        self.num_of_deals_explanation_cache = None   # rendered on demand by __repr__
+        self.gft_cache = self.recipe_tree.optimal_trade_GFT()
 
     def num_of_deals(self):
         return self.num_of_deals_cache
@@ -62,11 +80,14 @@ class TradeWithMultipleRecipes(Trade):
     def __repr__(self):
         if self.num_of_deals_cache==0:
             return "No trade"
+        if self.num_of_deals_explanation_cache is None:
+            self.num_of_deals_explanation_cache = self.recipe_tree.explain_num_of_deals(self.num_of_deals_per_node, self.prices)
         return self.num_of_deals_explanation_cache.rstrip()
 
 
 def budget_balanced_ascending_auction_twolevels(
-        market:Market, ps_recipe_counts: List[Any])->TradeWithMultipleRecipes:
+        market:Market, ps_recipe_counts: List[Any], price_resolution:int=None, price_tick:float=None,
+        recorder:PriceTrajectoryRecorder=None)->TradeWithMultipleRecipes:
     """
     Calculate the trade and prices using generalized-ascending-auction.
     Allows multiple non-binary recipes, but they must be represented by a *recipe tree* with two levels.
@@ -74,6 +95,11 @@ def budget_balanced_ascending_auction_twolevels(
     :param market:           contains a list of k categories, each containing several agents.
                              category 0 is the root; the others are its children.
     :param ps_recipe_counts: Required number r_g for each category g.
+    :param price_resolution: if given, prices are computed exactly in integer fixed-point units
+                             (see prices.FixedPointScale); e.g. 100 when all values are in cents.
+    :param price_tick:       if given, the prices rise like a discrete clock, by whole ticks of the price-sum;
+                             the auction stops at the first tick where the price-sum is non-negative.
+    :param recorder:         if given, every price change is recorded in it (see prices.PriceTrajectoryRecorder).
 
     :return: Trade object, representing the trade and prices.
 
@@ -111,20 +137,55 @@ def budget_balanced_ascending_auction_twolevels(
     """
     logger.info("\n#### Multi-Recipe Budget-Balanced Ascending Auction\n")
     logger.info(market)
+    return AscendingAuctionState(market, ps_recipe_counts, price_resolution=price_resolution, price_tick=price_tick, recorder=recorder).run()
 
-    root_count = ps_recipe_counts[0]
-    logger.info("Root category required count:   %d", root_count)
-    child_counts = ps_recipe_counts[1:]
-    num_recipes = len(child_counts)
-    logger.info("Child category required counts: %s", child_counts)
-    ps_recipes = [
-        [root_count] + recipe_index*[0] + [child_counts[recipe_index]] + (num_recipes-recipe_index-1)*[0]
-        for recipe_index in range(num_recipes)]
-    logger.info("PS recipes: %s", ps_recipes)
-    prices = SimultaneousAscendingPriceVectors(ps_recipes, -MAX_VALUE)
-
-    remaining_market = market.clone()
-    while True:
+
+class AscendingAuctionState(AuctionState):
+    """
+    The state of a two-level recipe-tree ascending auction, that can be run step by step (see auction_state.AuctionState).
+    Each step increases either the root price, or the prices of all children,
+    and removes the agents who do not want to trade in the new prices (unless the price-sum crosses zero).
+
+    >>> market = Market([AgentCategory("buyer", [9.,8.]),  AgentCategory("seller", [-4.,-3.])])
+    >>> state = AscendingAuctionState(market, [1, 1])
+    >>> state.step(), state.done
+    (<AuctionEvent.AGENT_REMOVED: 1>, False)
+    >>> print(state.remaining_market)
+    Traders: [buyer: [9.0, 8.0], seller: [-3.0]]
+    >>> saved = state.checkpoint()
+    >>> state.run_until(AuctionEvent.PRICE_CROSSED_ZERO), state.done
+    (<AuctionEvent.PRICE_CROSSED_ZERO: 2>, True)
+    >>> print(saved.remaining_market)
+    Traders: [buyer: [9.0, 8.0], seller: [-3.0]]
+    """
+
+    def __init__(self, market:Market, ps_recipe_counts: List[Any], price_resolution:int=None, price_tick:float=None,
+                 recorder:PriceTrajectoryRecorder=None):
+        """
+        :param market, ps_recipe_counts, price_resolution, price_tick, recorder: see budget_balanced_ascending_auction_twolevels.
+        """
+        super().__init__()
+        self.recorder = recorder
+        self.ps_recipe_counts = ps_recipe_counts
+        self.root_count = root_count = ps_recipe_counts[0]
+        logger.info("Root category required count:   %d", root_count)
+        self.child_counts = child_counts = ps_recipe_counts[1:]
+        num_recipes = len(child_counts)
+        logger.info("Child category required counts: %s", child_counts)
+        ps_recipes = [
+            [root_count] + recipe_index*[0] + [child_counts[recipe_index]] + (num_recipes-recipe_index-1)*[0]
+            for recipe_index in range(num_recipes)]
+        logger.info("PS recipes: %s", ps_recipes)
+        paths_to_leaf = [[0, child_index] for child_index in range(1, num_recipes+1)]
+        initial_prices = calculate_initial_prices_for_recipe_tree(paths_to_leaf, market.num_categories, -MAX_VALUE, required_counts=ps_recipe_counts)
+        # Each round increases either the root price (in all recipes) or all the child prices (one per recipe),
+        # so it is enough to verify that there is exactly one increase per recipe in the first round.
+        self.prices = SimultaneousAscendingPriceVectors(ps_recipes, -MAX_VALUE, initial_prices=initial_prices, resolution=price_resolution, tick=price_tick,
+                                                        always_validate=False)
+        self.remaining_market = market.clone()
+
+    def _step(self)->AuctionEvent:
+        remaining_market, prices, root_count, child_counts = self.remaining_market, self.prices, self.root_count, self.child_counts
         root_category = remaining_market.categories[0]
         root_category_size = len(root_category)
         normalized_root_category_size = root_category_size / root_count
@@ -138,42 +199,55 @@ def budget_balanced_ascending_auction_twolevels(
         if normalized_root_category_size > normalized_child_category_size: # increase only the root price
             prices_to_increase = [0]
         else: # increase the children prices
-            prices_to_increase = range(1,market.num_categories)
+            prices_to_increase = range(1,remaining_market.num_categories)
 
         increases = []
         for category_index in prices_to_increase:
             category = remaining_market.categories[category_index]
             target_price = category.lowest_agent_value() if category.size()>0 else MAX_VALUE
             increases.append((category_index, target_price, category.name))
-        
-        logger.info("\n")
-        # logger.info(remaining_market)
-        # logger.info("Largest category indices are %s. Largest category size = %d, combined category size = %d", indices_of_prices_to_increase, largest_category_size, combined_category_size)
-
-        # if combined_category_size == 0:
-        #     logger.info("\nCombined category size is 0 - no trade!")
-        #     logger.info("  Final price-per-unit vector: %s", prices)
-        #     logger.info(remaining_market)
-        #     return TradeWithMultipleRecipes(remaining_market.categories, recipe_tree, prices.map_category_index_to_price())
 
+        logger.info("\n")
         logger.info("Planned price-increases: %s", increases)
+        recorded_indices = old_prices = None
+        if self.recorder is not None:
+            recorded_indices = list(dict.fromkeys(prices_to_increase))   # each category once, in order
+            current_prices = prices.map_category_index_to_price()
+            old_prices = [current_prices[category_index] for category_index in recorded_indices]
         prices.increase_prices(increases)
         map_category_index_to_price = prices.map_category_index_to_price()
 
         if prices.status == PriceStatus.STOPPED_AT_ZERO_SUM:
+            self._record(recorded_indices, old_prices, map_category_index_to_price)
             logger.info("\nPrice crossed zero.")
             logger.info("  Final price-per-unit vector: %s", map_category_index_to_price)
             logger.info(remaining_market)
-            return TradeWithMultipleRecipes(remaining_market.categories, ps_recipe_counts, map_category_index_to_price)
-
-        else: # Remove agents who do not want to trade in the new prices:
-            for category_index in prices_to_increase:
-                category = remaining_market.categories[category_index]
-                if map_category_index_to_price[category_index] is not None \
-                    and category.size()>0 \
-                    and category.lowest_agent_value() <= map_category_index_to_price[category_index]:
-                        category.remove_lowest_agent()
-                        logger.info("{} after: {} agents remain".format(category.name, category.size()))
+            self.final_trade = TradeWithMultipleRecipes(remaining_market.categories, self.ps_recipe_counts, map_category_index_to_price)
+            return AuctionEvent.PRICE_CROSSED_ZERO
+
+        # Remove agents who do not want to trade in the new prices:
+        for category_index in prices_to_increase:
+            category = remaining_market.categories[category_index]
+            if map_category_index_to_price[category_index] is not None \
+                and category.size()>0 \
+                and category.lowest_agent_value() <= map_category_index_to_price[category_index]:
+                    category.remove_lowest_agent()
+                    logger.info("%s after: %d agents remain", category.name, category.size())
+        self._record(recorded_indices, old_prices, map_category_index_to_price)
+        return AuctionEvent.AGENT_REMOVED
+
+    def _record(self, category_indices:list, old_prices:list, new_prices:list):
+        """
+        Record the price-increases of the current round in the recorder (if any), as a single batch.
+        :param category_indices, old_prices: the categories whose prices increased, and their prices before the round.
+        :param new_prices: the price of every category after the round.
+        """
+        if self.recorder is None:
+            return
+        categories = self.remaining_market.categories
+        self.recorder.record_round(self.num_of_steps+1, self.prices.status, category_indices, old_prices,
+            [new_prices[category_index] for category_index in category_indices],
+            [categories[category_index].size() for category_index in category_indices])
 
 
 
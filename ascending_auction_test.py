@@ -16,14 +16,14 @@ ascending_auction_protocol.logger.setLevel(logging.WARNING)
 prices.logger.setLevel(logging.WARNING)
 
 from typing import *
-import unittest
+import unittest, random
 
 class TestAscendingAuction(unittest.TestCase):
 
     ## Helper functions:
 
     def _check_market(self, market: Market, ps_recipe:List[int], expected_num_of_deals:int, expected_prices:List[float]):
-        trade = ascending_auction_protocol.budget_balanced_ascending_auction(market, ps_recipe)
+        trade = ascending_auction_protocol.budget_balanced_ascending_auction(market, ps_recipe, cross_check=True)
         self.assertEqual(trade.num_of_deals(), expected_num_of_deals)
         for i, expected_price in enumerate(expected_prices):
             if expected_price is not None:
@@ -157,6 +157,94 @@ class TestAscendingAuction(unittest.TestCase):
         check_1_0_1(buyers=[9,8], mediators=[-5,-7], sellers=[-4,-3],
             expected_num_of_deals=1, expected_prices=[8,None,-8])
 
+    def test_float_price_sum_after_initial_prices(self):
+        """
+        Test that the running price-sum does not keep the rounding error of the initial prices (-MAX_VALUE),
+        so the float outcome is the same as with a price-sum that is re-computed from scratch in every round.
+        """
+        market = Market([
+            AgentCategory("buyer", [44.83, 43.01, 42.98, 39.82, 39.38, 37.09, 25.12, 20.72, 17.95, 17.91, 16.52, 14.6, 1.64, 1.06, 0.17]),
+            AgentCategory("seller", [-0.56, -0.73, -0.91, -0.97, -1.11, -1.86, -4.05, -4.85, -6.6, -8.07, -9.54, -10.02, -11.61, -11.94, -12.03, -13.4, -13.63]),
+        ])
+        trade = ascending_auction_protocol.budget_balanced_ascending_auction(market, [2,3])
+        self.assertEqual([category.size() for category in trade.categories], [9, 14])
+        self.assertEqual(trade.prices, [17.91, -11.94])
+
+    def test_event_engine_on_random_markets(self):
+        """
+        Test that the event-jumping engine gives the same outcome as the round-by-round engine.
+        """
+        random.seed(1)
+        for iteration in range(300):
+            num_categories = random.randint(1,4)
+            ps_recipe = [random.choice([0,1,1,2,3]) for _ in range(num_categories)]
+            ps_recipe[0] = max(ps_recipe[0], 1)
+            market = Market(
+                [AgentCategory("buyer", [random.randint(1,40) for _ in range(random.randint(0,8))])] +
+                [AgentCategory("seller", [-random.randint(1,15) for _ in range(random.randint(0,8))]) for _ in range(num_categories-1)])
+            for price_resolution in [None, 1]:
+                rounds_trade = ascending_auction_protocol.budget_balanced_ascending_auction(market, ps_recipe, price_resolution=price_resolution, engine="rounds")
+                events_trade = ascending_auction_protocol.budget_balanced_ascending_auction(market, ps_recipe, price_resolution=price_resolution, engine="events")
+                self.assertEqual(events_trade.num_of_deals(), rounds_trade.num_of_deals())
+                self.assertEqual([len(category) for category in events_trade.categories], [len(category) for category in rounds_trade.categories])
+                for (events_price, rounds_price) in zip(events_trade.prices, rounds_trade.prices):
+                    self.assertAlmostEqual(events_price, rounds_price)
+
+    def test_event_engine_on_non_integer_markets(self):
+        """
+        Test the cross-check of the two engines with non-integer values:
+        exactly in fixed-point mode, and up to the rounding errors in float mode.
+        """
+        random.seed(4)
+        for iteration in range(1000):
+            num_categories = random.randint(1,4)
+            ps_recipe = [random.choice([0,1,1,2,3]) for _ in range(num_categories)]
+            ps_recipe[0] = max(ps_recipe[0], 1)
+            denominator = random.choice([3, 7, 100])   # values on a grid of 1/denominator, so ties are common
+            market = Market(
+                [AgentCategory("buyer", [random.randint(0,50*denominator)/denominator for _ in range(random.randint(0,15))])] +
+                [AgentCategory("seller", [-random.randint(0,15*denominator)/denominator for _ in range(random.randint(0,15))]) for _ in range(num_categories-1)])
+            ascending_auction_protocol.budget_balanced_ascending_auction(market, ps_recipe, cross_check=True)
+            ascending_auction_protocol.budget_balanced_ascending_auction(market, ps_recipe, price_resolution=2100, cross_check=True)
+
+    def test_interleaved_auction_states(self):
+        """
+        Test that auctions driven cooperatively, one step at a time, give the same outcomes as running each auction to completion.
+        """
+        random.seed(2)
+        markets = [Market([AgentCategory("buyer", [random.randint(1,40) for _ in range(random.randint(0,8))]),
+                           AgentCategory("seller", [-random.randint(1,15) for _ in range(random.randint(0,8))])])
+                   for _ in range(50)]
+        states = [ascending_auction_protocol.AscendingAuctionState(market, [1,2]) for market in markets]
+        while not all(state.done for state in states):
+            for state in states:
+                if not state.done:
+                    state.step()
+        for (market, state) in zip(markets, states):
+            expected_trade = ascending_auction_protocol.budget_balanced_ascending_auction(market, [1,2])
+            self.assertEqual(state.trade().prices, expected_trade.prices)
+            self.assertEqual(state.trade().num_of_deals(), expected_trade.num_of_deals())
+
+    def test_price_trajectory_recorder(self):
+        """
+        Test that the recorded price trajectory is consistent with the final prices and the category sizes.
+        """
+        random.seed(3)
+        for _ in range(50):
+            market = Market([AgentCategory("buyer", [random.randint(1,40) for _ in range(random.randint(1,8))]),
+                             AgentCategory("seller", [-random.randint(1,15) for _ in range(random.randint(1,8))])])
+            recorder = prices.PriceTrajectoryRecorder(initial_capacity=1)
+            trade = ascending_auction_protocol.budget_balanced_ascending_auction(market, [1,2], recorder=recorder)
+            rows = recorder.rows
+            self.assertEqual(rows["round"].tolist(), list(range(1, len(rows)+1)))
+            for category_index in range(2):
+                category_rows = rows[rows["category"]==category_index]
+                if len(category_rows) > 0:
+                    self.assertEqual(category_rows["new_price"][-1], trade.prices[category_index])
+                    self.assertEqual(category_rows["old_price"][1:].tolist(), category_rows["new_price"][:-1].tolist())
+                    self.assertEqual(category_rows["size"][-1], trade.categories[category_index].size())
+
+
 if __name__ == '__main__':
     unittest.main()
 
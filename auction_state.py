@@ -0,0 +1,93 @@
+#!python3
+
+"""
+class AuctionState
+A base class for auctions that can be run step by step.
+It allows a caller to interleave many auctions on a single event loop,
+to pause and resume them, to checkpoint them, and to stop them at a time budget.
+"""
+
+from enum import Enum
+from trade import Trade
+import copy, time
+
+
+class AuctionEvent(Enum):
+    AGENT_REMOVED = 1        # the step ended with the removal of agents who do not want to trade in the new prices.
+    PRICE_CROSSED_ZERO = 2   # the price-sum reached zero - the auction is done.
+    NO_TRADE = 3             # a category became empty before the price-sum reached zero - the auction is done with no trade.
+
+
+class AuctionState:
+    """
+    The state of an auction that runs step by step.
+    Subclasses hold the remaining market and the price vector, and implement _step,
+    which runs a single round of the auction, sets self.final_trade when the auction is done, and returns an AuctionEvent.
+    """
+
+    def __init__(self):
+        self.num_of_steps = 0
+        self.last_event = None      # the event of the latest step. Of type AuctionEvent.
+        self.final_trade = None     # the outcome of the auction, once it is done.
+
+    @property
+    def done(self)->bool:
+        return self.final_trade is not None
+
+    def _step(self)->AuctionEvent:
+        """
+        Run a single round of the auction; implemented by each subclass (see the class docstring).
+        """
+        raise NotImplementedError("{} does not implement _step".format(type(self).__name__))
+
+    def step(self)->AuctionEvent:
+        """
+        Run a single round of the auction.
+        :return: the event with which the round ended.
+        """
+        if self.done:
+            raise ValueError("The auction is already done")
+        self.last_event = self._step()
+        self.num_of_steps += 1
+        return self.last_event
+
+    def run_until(self, event:AuctionEvent=None, max_steps:int=None, deadline:float=None)->AuctionEvent:
+        """
+        Run rounds of the auction until it is done, or until one of the given conditions holds.
+        :param event: stop after a round that ends with this event.
+        :param max_steps: stop after this many rounds.
+        :param deadline: stop after the first round that ends at or after this time (in the clock of time.monotonic).
+        :return: the event of the latest round (None if no round was run).
+        """
+        num_of_steps = 0
+        while not self.done:
+            if max_steps is not None and num_of_steps >= max_steps:
+                break
+            if self.step() == event:
+                break
+            num_of_steps += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return self.last_event
+
+    def run(self)->Trade:
+        """
+        Run the auction to completion.
+        :return: the trade.
+        """
+        self.run_until()
+        return self.final_trade
+
+    def trade(self)->Trade:
+        """
+        :return: the outcome of the auction. Raises ValueError if it is not done yet.
+        """
+        if not self.done:
+            raise ValueError("The auction is not done yet")
+        return self.final_trade
+
+    def checkpoint(self)->"AuctionState":
+        """
+        :return: an independent copy of this state. Running the copy does not affect this state, and vice versa.
+        """
+        return copy.deepcopy(self)
@@ -0,0 +1,301 @@
+#!python3
+
+"""
+class ClockAuctionServer
+An asyncio service that runs the single-recipe strongly-budget-balanced ascending auction
+(see ascending_auction_protocol) as a real clock auction: the server does not know the agents' values.
+In each round, it broadcasts the current price vector to the connected bidders,
+collects their "stay"/"drop" responses until a per-round deadline (a missing response counts as "stay"),
+and then advances the clock of the main category by a single tick, or removes one bidder who wants to drop.
+A dropping bidder reports its exit price, like the intra-round exit bids of clock auctions,
+so that when several bidders drop in the same round, the server removes the one with the lowest exit price,
+as the protocol removes the agent with the lowest value.
+
+class SimulatedBidderPool
+An in-process pool of simulated bidders, connected to the server by asyncio queues,
+for measuring the round latency and the throughput of the server without a real network.
+
+function run_simulated_clock_auction
+Runs a clock auction with simulated bidders, whose values are taken from a given market.
+"""
+
+from agents import AgentCategory
+from markets import Market
+from trade import TradeWithSinglePrice
+from prices import AscendingPriceVector, PriceStatus, FixedPointScale
+from ascending_auction_protocol import CategoryQueue
+from typing import *
+
+import asyncio, random, time
+import logging, sys
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+# To enable tracing, set logger.setLevel(logging.INFO)
+
+
+class BidderConnection:
+    """
+    The server side of a connection to a single bidder.
+    The server puts messages in the inbox: (round_number, prices) in each round, and None when the bidder leaves the auction.
+    The bidder puts its responses in the shared outbox: (round_number, bidder_id, exit_price),
+    where exit_price is None if the bidder wants to stay, and otherwise the price at which it stopped wanting to trade.
+    """
+    def __init__(self, bidder_id:int, category_index:int, inbox:asyncio.Queue, outbox:asyncio.Queue):
+        self.bidder_id = bidder_id
+        self.category_index = category_index
+        self.inbox = inbox
+        self.outbox = outbox
+
+
+class ClockAuctionResult:
+    """
+    The outcome of a clock auction, with statistics on its rounds.
+    """
+    def __init__(self, prices:List[float], status:PriceStatus, remaining_bidders:List[List[int]],
+                 round_latencies:List[float], num_of_responses:int, num_of_late_responses:int, elapsed_time:float):
+        self.prices = prices
+        self.status = status                        # STOPPED_AT_ZERO_SUM, or None if a category became empty (no trade).
+        self.remaining_bidders = remaining_bidders  # for each category, the ids of the bidders who remain in the auction.
+        self.round_latencies = round_latencies      # for each round, the time (in seconds) from the broadcast until all responses arrived or the deadline passed.
+        self.num_of_responses = num_of_responses
+        self.num_of_late_responses = num_of_late_responses  # responses that arrived after the deadline of their round.
+        self.elapsed_time = elapsed_time
+
+    @property
+    def num_of_rounds(self)->int:
+        return len(self.round_latencies)
+
+    def mean_round_latency(self)->float:
+        return sum(self.round_latencies) / len(self.round_latencies) if self.round_latencies else 0
+
+    def max_round_latency(self)->float:
+        return max(self.round_latencies, default=0)
+
+    def throughput(self)->float:
+        """
+        :return: the number of bidder responses processed per second.
+        """
+        return self.num_of_responses / self.elapsed_time if self.elapsed_time > 0 else 0
+
+    def __repr__(self):
+        return "prices={}, status={}, sizes={}, {} rounds, mean round latency {:.2f} ms, max {:.2f} ms, {:.0f} responses/s".format(
+            self.prices, self.status, [len(bidders) for bidders in self.remaining_bidders], self.num_of_rounds,
+            1000*self.mean_round_latency(), 1000*self.max_round_latency(), self.throughput())
+
+
+class ClockAuctionServer:
+    """
+    A clock auction server, using the price logic of ascending_auction_protocol in the discrete-clock mode:
+    the clock of the category with the largest number of potential PS advances by one tick per round,
+    until a bidder of that category drops; then the dropping bidder with the lowest exit price is removed
+    and the main category is chosen again (by the CategoryQueue of the protocol).
+    The auction ends when the price-sum reaches zero, or when the main category becomes empty (no trade).
+
+    A bidder should ask to drop when the price of its category is at least its value.
+    When the bidders respond truthfully and on time, the outcome (prices and remaining traders) is identical to that of
+    ascending_auction_protocol.AscendingAuctionState with the same initial price, price_resolution and price_tick.
+    """
+    def __init__(self, ps_recipe:List[int], category_names:List[str], initial_price, price_tick:float,
+                 price_resolution:int=None, round_deadline:float=1.0):
+        """
+        :param ps_recipe: the PS recipe - the number of agents of each category in each procurement-set.
+        :param category_names: the name of each category, for logging.
+        :param initial_price: the initial price of each category (a number or a list). The initial price-sum must be negative.
+        :param price_tick: the increase of the price-sum in each tick of the clock.
+        :param price_resolution: if given, the prices are computed exactly in integer fixed-point units (see prices.FixedPointScale).
+        :param round_deadline: the time (in seconds) to wait for the responses in each round.
+        """
+        if len(ps_recipe) != len(category_names):
+            raise ValueError("There are {} categories but {} elements in the PS recipe".format(len(category_names), len(ps_recipe)))
+        self.ps_recipe = ps_recipe
+        self.category_names = category_names
+        scale = None if price_resolution is None else FixedPointScale(price_resolution, [ps_recipe])
+        if isinstance(initial_price, list):
+            initial_price = list(initial_price)
+        self.prices = AscendingPriceVector(ps_recipe, initial_price, scale=scale, tick=price_tick)
+        self.round_deadline = round_deadline
+        self.bidders = {}   # bidder id -> BidderConnection
+        self.active_bidders = [{} for _ in ps_recipe]   # for each category, the ids of the bidders who remain (as dict keys, in order of connection).
+        self.responses = asyncio.Queue()
+
+    def connect(self, category_index:int)->BidderConnection:
+        """
+        Connect a new bidder of the given category. Must be called before run.
+        """
+        bidder_id = len(self.bidders)
+        connection = BidderConnection(bidder_id, category_index, asyncio.Queue(), self.responses)
+        self.bidders[bidder_id] = connection
+        self.active_bidders[category_index][bidder_id] = None
+        return connection
+
+    async def run(self)->ClockAuctionResult:
+        """
+        Run the auction until it ends.
+        """
+        ps_recipe, prices, active_bidders = self.ps_recipe, self.prices, self.active_bidders
+        category_queue = CategoryQueue(ps_recipe, [len(bidders) for bidders in active_bidders])
+        round_latencies = []
+        self.num_of_responses = self.num_of_late_responses = 0
+        start_time = time.perf_counter()
+        status = None
+        while True:
+            main_category_index = category_queue.main_category_index()
+            main_category_name = self.category_names[main_category_index]
+            if len(active_bidders[main_category_index]) == 0:
+                logger.info("The %s category became empty - no trade!", main_category_name)
+                break
+
+            round_number = len(round_latencies) + 1
+            round_start_time = time.perf_counter()
+            droppers = await self._run_round(round_number)
+            round_latencies.append(time.perf_counter() - round_start_time)
+
+            main_category_droppers = [(exit_price, bidder_id) for (bidder_id, exit_price) in droppers.items() if self.bidders[bidder_id].category_index == main_category_index]
+            if main_category_droppers:
+                # Like the protocol, remove a single agent - the one with the lowest value - and then choose the main category again.
+                (_, dropper) = min(main_category_droppers)
+                del active_bidders[main_category_index][dropper]
+                category_queue.update_main_category(len(active_bidders[main_category_index]))
+                self.bidders[dropper].inbox.put_nowait(None)
+                logger.info("Round %d: bidder %d of %s dropped; %d remain", round_number, dropper, main_category_name, len(active_bidders[main_category_index]))
+                continue
+
+            prices.increase_price_by_ticks(main_category_index, 1, main_category_name)
+            logger.info("Round %d: %s price increases to %s", round_number, main_category_name, prices[main_category_index])
+            if prices.status == PriceStatus.STOPPED_AT_ZERO_SUM:
+                logger.info("Price crossed zero. Final price-per-unit vector: %s", prices)
+                status = PriceStatus.STOPPED_AT_ZERO_SUM
+                break
+
+        for bidders in active_bidders:
+            for bidder_id in bidders:
+                self.bidders[bidder_id].inbox.put_nowait(None)
+        return ClockAuctionResult(list(prices.prices), status, [list(bidders) for bidders in active_bidders],
+            round_latencies, self.num_of_responses, self.num_of_late_responses, time.perf_counter() - start_time)
+
+    async def _run_round(self, round_number:int)->Dict[int,float]:
+        """
+        Broadcast the current prices to all active bidders, and collect their responses until the round deadline.
+        :return: a dict from the ids of the bidders who want to drop to their exit prices.
+        """
+        message = (round_number, tuple(self.prices.prices))
+        num_of_active_bidders = 0
+        for bidders in self.active_bidders:
+            num_of_active_bidders += len(bidders)
+            for bidder_id in bidders:
+                self.bidders[bidder_id].inbox.put_nowait(message)
+        droppers = {}
+        try:
+            await asyncio.wait_for(self._collect_responses(round_number, num_of_active_bidders, droppers), self.round_deadline)
+        except asyncio.TimeoutError:
+            logger.info("Round %d: deadline passed; the missing responses count as 'stay'", round_number)
+        return droppers
+
+    async def _collect_responses(self, round_number:int, num_of_expected_responses:int, droppers:Dict[int,float]):
+        num_of_responses = 0
+        while num_of_responses < num_of_expected_responses:
+            (response_round_number, bidder_id, exit_price) = await self.responses.get()
+            self.num_of_responses += 1
+            if response_round_number != round_number:
+                self.num_of_late_responses += 1
+                continue
+            num_of_responses += 1
+            if exit_price is not None:
+                droppers[bidder_id] = exit_price
+
+
+class SimulatedBidderPool:
+    """
+    A pool of simulated bidders, one per agent of the given market, each running as an asyncio task.
+    A simulated bidder asks to drop when the price of its category is at least its value, and reports its value as its exit price.
+    """
+    def __init__(self, market:Market, max_response_delay:float=0, no_response_probability:float=0):
+        """
+        :param market: the agents' values.
+        :param max_response_delay: each response is delayed by a random time (in seconds) up to this bound.
+        :param no_response_probability: in each round, each bidder does not respond with this probability.
+        """
+        self.market = market
+        self.max_response_delay = max_response_delay
+        self.no_response_probability = no_response_probability
+        self.values = {}    # bidder id -> value
+
+    def connect(self, server:ClockAuctionServer)->List[Coroutine]:
+        """
+        Connect all bidders to the given server.
+        :return: the coroutines of the bidders.
+        """
+        bidders = []
+        for (category_index, category) in enumerate(self.market.categories):
+            for value in category.values:
+                connection = server.connect(category_index)
+                self.values[connection.bidder_id] = value
+                bidders.append(self._bid(connection, value))
+        return bidders
+
+    async def _bid(self, connection:BidderConnection, value:float):
+        while True:
+            message = await connection.inbox.get()
+            if message is None:
+                return
+            (round_number, prices) = message
+            if self.no_response_probability > 0 and random.random() < self.no_response_probability:
+                continue
+            if self.max_response_delay > 0:
+                await asyncio.sleep(random.uniform(0, self.max_response_delay))
+            connection.outbox.put_nowait((round_number, connection.bidder_id, value if prices[connection.category_index] >= value else None))
+
+    def trade(self, server:ClockAuctionServer, result:ClockAuctionResult)->TradeWithSinglePrice:
+        """
+        :return: the trade resulting from the auction, using the values of the simulated bidders.
+        """
+        categories = [AgentCategory(category.name, [self.values[bidder_id] for bidder_id in bidders])
+                      for (category, bidders) in zip(self.market.categories, result.remaining_bidders)]
+        return TradeWithSinglePrice(categories, server.ps_recipe, result.prices)
+
+
+async def _run_simulated_clock_auction(market:Market, ps_recipe:List[int], initial_price, price_tick:float,
+                                       price_resolution:int, round_deadline:float, max_response_delay:float, no_response_probability:float):
+    server = ClockAuctionServer(ps_recipe, [category.name for category in market.categories], initial_price, price_tick,
+                                price_resolution=price_resolution, round_deadline=round_deadline)
+    pool = SimulatedBidderPool(market, max_response_delay=max_response_delay, no_response_probability=no_response_probability)
+    bidder_tasks = [asyncio.ensure_future(bidder) for bidder in pool.connect(server)]
+    result = await server.run()
+    await asyncio.gather(*bidder_tasks)
+    return (result, pool.trade(server, result))
+
+
+def run_simulated_clock_auction(market:Market, ps_recipe:List[int], initial_price, price_tick:float, price_resolution:int=None,
+                                round_deadline:float=1.0, max_response_delay:float=0, no_response_probability:float=0)->Tuple[ClockAuctionResult, TradeWithSinglePrice]:
+    """
+    Run a clock auction with simulated bidders, whose values are taken from the given market.
+    See ClockAuctionServer and SimulatedBidderPool for the parameters.
+    :return: the result of the server (with the round statistics), and the resulting trade.
+
+    >>> market = Market([AgentCategory("buyer", [9.,8.,7.,6.]),  AgentCategory("seller", [-1.,-2.,-3.,-4.,-5.,-6.,-7.])])
+    >>> (result, trade) = run_simulated_clock_auction(market, [1,1], initial_price=-10, price_tick=1, price_resolution=1)
+    >>> result.prices, result.num_of_rounds
+    ([5.0, -5.0], 23)
+    >>> print(trade)
+    buyer: [9.0, 8.0, 7.0, 6.0]: all 4 agents trade and pay 5.0
+    seller: [-1.0, -2.0, -3.0, -4.0]: all 4 agents trade and pay -5.0
+    """
+    return asyncio.run(_run_simulated_clock_auction(market, ps_recipe, initial_price, price_tick,
+                                                    price_resolution, round_deadline, max_response_delay, no_response_probability))
+
+
+if __name__ == "__main__":
+    import doctest
+    (failures,tests) = doctest.testmod(report=True)
+    print ("{} failures, {} tests".format(failures,tests))
+
+    # Measure the round latency and throughput with 10^4 concurrent simulated bidders.
+    # Each round is a broadcast to all bidders, so the values are chosen such that the auction ends within a few dozen rounds.
+    num_of_agents_per_category = 5000
+    market = Market([
+        AgentCategory.uniformly_random("buyer", num_of_agents_per_category, 50, 100),
+        AgentCategory.uniformly_random("seller", num_of_agents_per_category, -30, -1),
+    ])
+    (result, trade) = run_simulated_clock_auction(market, [1,1], initial_price=[0,-31], price_tick=1, price_resolution=100)
+    print(result)
+    print(trade)
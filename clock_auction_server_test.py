@@ -0,0 +1,76 @@
+#!python3
+
+"""
+Unit-test for the clock-auction server with simulated bidders.
+"""
+
+from markets import Market
+from agents import AgentCategory
+import clock_auction_server, ascending_auction_protocol, prices
+
+import logging
+clock_auction_server.logger.setLevel(logging.WARNING)
+ascending_auction_protocol.logger.setLevel(logging.WARNING)
+prices.logger.setLevel(logging.WARNING)
+
+import unittest, random
+
+
+class TestClockAuctionServer(unittest.TestCase):
+
+    def test_same_outcome_as_protocol(self):
+        """
+        With truthful bidders who respond on time, the server should give the same outcome as the ascending auction
+        in the discrete-clock mode.
+        """
+        random.seed(3)
+        for price_tick in [1, 3, 5]:
+            for iteration in range(30):
+                ps_recipe = random.choice([[1,1], [1,2], [2,1], [1,1,1]])
+                market = Market(
+                    [AgentCategory("buyer", [random.randint(1,20) for _ in range(random.randint(0,6))])] +
+                    [AgentCategory("seller", [-random.randint(1,10) for _ in range(random.randint(0,6))]) for _ in ps_recipe[1:]])
+                initial_price = [0] + [-10]*(len(ps_recipe)-1)
+                (result, trade) = clock_auction_server.run_simulated_clock_auction(
+                    market, ps_recipe, initial_price=initial_price, price_tick=price_tick, price_resolution=2)
+                expected_trade = ascending_auction_protocol.AscendingAuctionState(
+                    market, ps_recipe, price_resolution=2, price_tick=price_tick, initial_price=initial_price).run()
+                self.assertEqual(result.prices, expected_trade.prices)
+                self.assertEqual([category.values for category in trade.categories], [category.values for category in expected_trade.categories])
+                self.assertEqual(trade.num_of_deals(), expected_trade.num_of_deals())
+
+    def test_simultaneous_droppers(self):
+        """
+        When several bidders of the main category drop in the same round, the one with the lowest value is removed first.
+        """
+        market = Market([AgentCategory("buyer", [9.,8.,7.]),  AgentCategory("seller", [-1.,-2.,-3.,-4.,-5.,-6.])])
+        (result, trade) = clock_auction_server.run_simulated_clock_auction(
+            market, [1,1], initial_price=[0,-10], price_tick=6, price_resolution=1)
+        expected_trade = ascending_auction_protocol.AscendingAuctionState(
+            market, [1,1], price_resolution=1, price_tick=6, initial_price=[0,-10]).run()
+        self.assertEqual(result.prices, expected_trade.prices)
+        self.assertEqual([category.values for category in trade.categories], [category.values for category in expected_trade.categories])
+
+    def test_missing_responses_count_as_stay(self):
+        """
+        When no bidder responds, every round ends at the deadline, and the clock advances until the price-sum reaches zero.
+        """
+        market = Market([AgentCategory("buyer", [9.,8.]),  AgentCategory("seller", [-4.,-3.])])
+        (result, trade) = clock_auction_server.run_simulated_clock_auction(
+            market, [1,1], initial_price=[-3,-5], price_tick=1, price_resolution=1, round_deadline=0.01, no_response_probability=1)
+        self.assertEqual(result.prices, [5.0, -5.0])
+        self.assertEqual(result.num_of_rounds, 8)
+        self.assertEqual(result.num_of_responses, 0)
+        self.assertEqual([len(bidders) for bidders in result.remaining_bidders], [2, 2])
+
+    def test_round_statistics(self):
+        market = Market([AgentCategory("buyer", [9.,8.,7.]),  AgentCategory("seller", [-4.,-3.,-2.])])
+        (result, trade) = clock_auction_server.run_simulated_clock_auction(
+            market, [1,1], initial_price=-10, price_tick=1, price_resolution=1, max_response_delay=0.001)
+        self.assertEqual(len(result.round_latencies), result.num_of_rounds)
+        self.assertGreater(result.throughput(), 0)
+        self.assertLessEqual(result.mean_round_latency(), result.max_round_latency())
+
+
+if __name__ == '__main__':
+    unittest.main()
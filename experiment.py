@@ -59,8 +59,10 @@ def experiment(results_csv_file:str, auction_function:Callable, auction_name:str
                 AgentCategory.uniformly_random("agent", num_of_agents_per_category*recipe[category], value_ranges[category][0], value_ranges[category][1])
                 for category in range(num_of_categories)
             ])
-            (optimal_trade, _) = market.optimal_trade(recipe)
             auction_trade = auction_function(market, recipe)
+            optimal_trade = auction_trade.optimal_trade   # attached by auctions run with diagnostics=True
+            if optimal_trade is None:
+                (optimal_trade, _) = market.optimal_trade(recipe)
 
             sum_optimal_count += optimal_trade.num_of_deals()
             sum_auction_count += auction_trade.num_of_deals()
@@ -11,7 +11,7 @@ Author: Erel Segal-Halevi
 Since: 2019-08
 """
 
-from agents import AgentCategory
+from agents import AgentCategory, abbreviated_list_str
 from trade import TradeWithMaterialBalance
 
 class Market:
@@ -22,6 +22,8 @@ class Market:
     >>> market = Market([AgentCategory("buyer", [9, 7, 11, 5]), AgentCategory("seller",[-4,-6,-8,-2])])
     >>> str(market)
     'Traders: [buyer: [11, 9, 7, 5], seller: [-2, -4, -6, -8]]'
+    >>> str(Market([AgentCategory("buyer", range(1000)), AgentCategory("seller", range(-1,-501,-1))]))
+    'Traders: [buyer: [999, 998, 997, ..., 2, 1, 0] (1000 items), seller: [-1, -2, -3, ..., -498, -499, -500] (500 items)]'
     """
 
     def __init__(self, categories:list):
@@ -219,7 +221,7 @@ class Market:
 
 
     def __str__(self)->str:
-        return "Traders: {}".format(self.categories)
+        return "Traders: {}".format(abbreviated_list_str(self.categories))
 
     def clone(self):
         return Market([c.clone() for c in self.categories])
@@ -154,11 +154,11 @@ def mcafee_trade_reduction(market:Market, ps_recipe:list, price_heuristic=True):
     for category in remaining_market.categories:
         if len(category)==0:
             category.append(-MAX_VALUE)
-    logger.info("Optimal trade, by increasing GFT: {}".format(optimal_trade))
+    logger.info("Optimal trade, by increasing GFT: %s", optimal_trade)
     first_negative_ps = remaining_market.get_highest_agents(ps_recipe)
     if price_heuristic:
         price_candidate = sum([abs(x) for x in first_negative_ps]) / len(first_negative_ps)
-        logger.info("First negative PS: {}, candidate price: {}".format(first_negative_ps, price_candidate))
+        logger.info("First negative PS: %s, candidate price: %s", first_negative_ps, price_candidate)
     actual_traders = market.empty_agent_categories()
 
     if optimal_trade.num_of_deals()>0:
@@ -0,0 +1,144 @@
+#!python3
+
+"""
+The optimal trade in a market with an arbitrary set of recipes.
+
+A recipe is a vector with the number of agents of each category that take part in a single deal.
+Unlike in a RecipeTree, a category may be shared by several recipes in any pattern
+(e.g. [1,1,0,0], [1,0,1,0] and [0,1,0,1]).
+
+The optimal trade is computed by a mixed-integer linear program (scipy.optimize.milp),
+with one integer variable per recipe (the number of deals that use it), and two variables per category:
+the number n_g of agents used from it, and its gain z_g.
+Since the agents in each category are sorted in descending order of their value,
+the gain of using the best n agents is the prefix-sum P_g(n), which is a concave piecewise-linear function of n;
+so each category is a single "arc" with a concave gain (convex cost), and z_g is bounded from above
+by the line of each linear piece: z_g <= P_g(k) + v_g[k] * (n_g - k).
+The number of variables does not depend on the number of agents; only the number of piece constraints does
+(one per distinct value in a category, with two non-zero coefficients each).
+
+For recipe-trees, RecipeTree.optimal_trade is much faster; this module serves as a reference for it
+(see recipetree_benchmark.py).
+
+scipy is imported only when a trade is computed.
+"""
+
+from typing import *
+from agents import AgentCategory
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def optimal_trade(categories:List[AgentCategory], recipes:List[List[int]])->(list,int,float):
+    """
+    Calculate the trade with the maximum gain-from-trade.
+
+    :param categories: a list of k categories; the agents in each category are sorted in descending order of their value.
+    :param recipes:    a list of recipes; each recipe is a list of k non-negative integers
+                       (usually 0 or 1): the number of agents of each category in a deal.
+    :return: a tuple:
+    * first element is the number of deals that use each recipe;
+    * second element is the optimal num of deals;
+    * third is the optimal GFT.
+    If there are several optimal trades, an arbitrary one of them is returned.
+
+    >>> categories = [AgentCategory("buyer", [60,40,20,-30]), AgentCategory("seller", [-10,-30,-50]), AgentCategory("producerA", [-1, -3, -5]), AgentCategory("producerB", [-2, -4, -6, -8])]
+    >>> optimal_trade(categories, [[1,1,0,0], [1,0,1,1]])   # the recipes of the tree [0, [1, None, 2, [3, None]]]
+    ([1, 2], 3, 100)
+    >>> optimal_trade(categories, [[1,1,0,0], [1,0,1,0], [0,1,0,1]])   # the seller category is shared by two recipes
+    ([0, 3, 0], 3, 111)
+    >>> optimal_trade(categories, [[1,2,0,0]])
+    ([1], 1, 20)
+    >>> optimal_trade(categories, [[0,1,1,0]])
+    ([0], 0, 0)
+    >>> optimal_trade(categories, [])
+    ([], 0, 0)
+
+    On recipe-trees, it finds the same GFT as RecipeTree.optimal_trade:
+
+    >>> import random
+    >>> from recipetree import RecipeTree, random_recipe_tree_market
+    >>> random.seed(1)
+    >>> markets = [random_recipe_tree_market(10, max_depth=4, max_fanout=3, num_of_agents_per_path=3) for _ in range(10)]
+    >>> all(abs(optimal_trade(market.categories, RecipeTree(market.categories, struct).recipes())[2] - RecipeTree(market.categories, struct).optimal_trade_GFT()) < 1e-6 for (market, struct) in markets)
+    True
+    """
+    num_of_recipes = len(recipes)
+    if num_of_recipes == 0:
+        return ([], 0, 0)
+    num_of_categories = len(categories)
+    for recipe in recipes:
+        if len(recipe) != num_of_categories or any(count < 0 for count in recipe):
+            raise ValueError("Each recipe should have {} non-negative counts, but got {}".format(num_of_categories, recipe))
+
+    import numpy as np
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    from scipy.sparse import csr_matrix, coo_matrix, hstack, identity
+
+    # Variables: [x_0..x_{R-1}] = the number of deals per recipe, then [n_0..n_{k-1}], then [z_0..z_{k-1}].
+    n_offset, z_offset = num_of_recipes, num_of_recipes + num_of_categories
+    num_of_variables = num_of_recipes + 2*num_of_categories
+
+    # For each category g:   n_g  -  sum over recipes r of recipes[r][g] * x_r  =  0.
+    recipe_matrix = csr_matrix(np.array(recipes, dtype=float).T)                 # k x R
+    count_constraint = LinearConstraint(hstack([-recipe_matrix, identity(num_of_categories), csr_matrix((num_of_categories, num_of_categories))]), 0, 0)
+
+    # For each category g and each linear piece k of its prefix-sum:   z_g - v_g[k] * n_g  <=  P_g(k) - v_g[k] * k.
+    # Consecutive pieces with the same slope lie on the same line, so only the first of them is needed.
+    rows, columns, coefficients, upper_limits = [], [], [], []
+    for (g, category) in enumerate(categories):
+        prefix_sum = 0
+        previous_value = None
+        for (k, value) in enumerate(category.values):
+            if value != previous_value:
+                row = len(upper_limits)
+                rows += [row, row]
+                columns += [z_offset+g, n_offset+g]
+                coefficients += [1, -value]
+                upper_limits.append(prefix_sum - value*k)
+                previous_value = value
+            prefix_sum += value
+    piece_matrix = coo_matrix((coefficients, (rows, columns)), shape=(len(upper_limits), num_of_variables))
+    constraints = [count_constraint]
+    if upper_limits:
+        constraints.append(LinearConstraint(piece_matrix, -np.inf, upper_limits))
+
+    # A recipe cannot be used more times than the number of agents in any of its categories.
+    # A category cannot use more agents than it has; an empty category has no gain.
+    sizes = [category.size() for category in categories]
+    max_deals = [min((size // count for (size, count) in zip(sizes, recipe) if count > 0), default=0) for recipe in recipes]
+    lower_bounds = [0]*num_of_recipes + [0]*num_of_categories + [-np.inf]*num_of_categories
+    upper_bounds = max_deals + sizes + [0 if size==0 else np.inf for size in sizes]
+    integrality = [1]*num_of_recipes + [0]*(2*num_of_categories)
+    objective = [0]*(num_of_recipes+num_of_categories) + [-1]*num_of_categories   # milp minimizes
+
+    result = milp(objective, constraints=constraints, integrality=integrality, bounds=Bounds(lower_bounds, upper_bounds),
+                  options={"mip_rel_gap": 0})   # a reference solver should be exact, not within the default gap of 0.01%
+    if not result.success:
+        raise ValueError("The optimal trade could not be computed: {}".format(result.message))
+    logger.info("MILP with %d recipes, %d categories and %d piece constraints: %s", num_of_recipes, num_of_categories, len(upper_limits), result.message)
+
+    # The GFT is recomputed exactly from the integral recipe counts, using the sorted values:
+    recipe_counts = [int(round(x)) for x in result.x[:num_of_recipes]]
+    category_counts = [sum(count*recipe[g] for (count, recipe) in zip(recipe_counts, recipes)) for g in range(num_of_categories)]
+    gft = sum(sum(category.values[:count]) for (category, count) in zip(categories, category_counts))
+    return (recipe_counts, sum(recipe_counts), gft)
+
+
+def optimal_trade_GFT(categories:List[AgentCategory], recipes:List[List[int]])->float:
+    """
+    Calculate the maximum possible GFT for the given recipes (see optimal_trade).
+
+    >>> categories = [AgentCategory("buyer", [60,40,20,-30]), AgentCategory("seller", [-10,-30,-50]), AgentCategory("producerA", [-1, -3, -5]), AgentCategory("producerB", [-2, -4, -6, -8])]
+    >>> optimal_trade_GFT(categories, [[1,1,0,0], [1,0,1,0], [0,1,0,1]])
+    111
+    """
+    return optimal_trade(categories, recipes)[2]
+
+
+
+if __name__=="__main__":
+    import doctest
+    (failures,tests) = doctest.testmod(report=True)
+    print ("doctest: {} failures, {} tests".format(failures,tests))
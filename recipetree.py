@@ -4,29 +4,221 @@
 A tree in which each node is an agent category,
 and each path from root to leaf is a recipe.
 
+The tree is stored compactly in index arrays (parent, first child, next sibling) with a precomputed post-order,
+and all methods traverse it iteratively. anytree is needed only for displaying the tree (see RecipeTree.to_anytree).
+
 For more information on tree implementations in Python, see here:
 https://stackoverflow.com/q/2358045/827927
 """
 
 from typing import *
-from anytree import Node, NodeMixin, RenderTree
 from agents import AgentCategory
-import logging, sys, collections
+import logging, sys, collections, heapq, operator, itertools, functools
 
 logger = logging.getLogger(__name__)
 
 
-# Code from https://stackoverflow.com/a/2158532/827927
-def flatten(l):
-    for el in l:
-        if isinstance(el, collections.abc.Iterable) and not isinstance(el, (str, bytes)):
-            yield from flatten(el)
-        else:
-            yield el
+class RecipeStructure:
+    """
+    The structure of a recipe-tree, independent of the categories in any specific market.
+    It is immutable and hashable: two structures are equal iff they have the same category indices in the same tree shape.
+    Its derived data (paths, recipes, recipe-category incidence, initial prices) is computed once and cached,
+    and recipe_structure() caches the structures themselves process-wide,
+    so running many auctions with the same structure builds it only once.
+
+    The nodes are numbered in pre-order, so the root is node 0 and each node comes before its descendants.
+    Missing links are represented by -1.
+
+    >>> structure = recipe_structure([0, [1, [2, None], 3, None, 4, None]])
+    >>> structure.node_category_index, structure.parent, structure.first_child, structure.next_sibling
+    ((0, 1, 2, 3, 4), (-1, 0, 1, 0, 0), (1, 2, -1, -1, -1), (-1, 3, -1, 4, -1))
+    >>> structure.postorder
+    (2, 1, 3, 4, 0)
+    >>> structure.paths_to_leaf()
+    ((0, 1, 2), (0, 3), (0, 4))
+    >>> structure.recipes(6)
+    ((1, 1, 1, 0, 0, 0), (1, 0, 0, 1, 0, 0), (1, 0, 0, 0, 1, 0))
+    >>> structure.recipes_of_category(6)
+    ((0, 1, 2), (0,), (0,), (1,), (2,), ())
+    >>> structure.initial_prices(5, -100)
+    [-100.0, -100.0, -100.0, -200.0, -200.0]
+    >>> recipe_structure([0, [1, [2, None], 3, None, 4, None]]) is structure
+    True
+    >>> recipe_structure([0, [3, None, 1, [2, None], 4, None]]) == structure
+    False
+    >>> recipe_structure([0, [1]])
+    Traceback (most recent call last):
+    ...
+    ValueError: RecipeTree must be initialized with an even-length list, containing indices and their children.
+    """
+
+    def __init__(self, node_category_index:Tuple[int], parent:Tuple[int]):
+        """
+        :param node_category_index: the category index of each node, in pre-order.
+        :param parent: the parent of each node (-1 for the root). Use recipe_structure() to create it from a nested list.
+        """
+        self.num_of_nodes = num_of_nodes = len(node_category_index)
+        self.node_category_index = tuple(node_category_index)
+        self.parent = tuple(parent)
+        first_child, next_sibling, last_child = [-1]*num_of_nodes, [-1]*num_of_nodes, [-1]*num_of_nodes
+        for node in range(1, num_of_nodes):   # in pre-order, so siblings are linked from left to right.
+            parent_node = parent[node]
+            if first_child[parent_node] < 0:
+                first_child[parent_node] = node
+            else:
+                next_sibling[last_child[parent_node]] = node
+            last_child[parent_node] = node
+        self.first_child = tuple(first_child)
+        self.next_sibling = tuple(next_sibling)
+
+        # Post-order: each node comes after all its descendants, and the children of a node are in order.
+        postorder = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            postorder.append(node)
+            stack.extend(self.children(node))
+        postorder.reverse()
+        self.postorder = tuple(postorder)
+
+        self.leaves = tuple(node for node in range(num_of_nodes) if first_child[node] < 0)   # ordered from left to right.
+        node_paths_to_leaf = []
+        for leaf in self.leaves:
+            path = []
+            node = leaf
+            while node >= 0:
+                path.append(node)
+                node = parent[node]
+            path.reverse()
+            node_paths_to_leaf.append(tuple(path))
+        self._node_paths_to_leaf = tuple(node_paths_to_leaf)
+        self._paths_to_leaf = tuple(tuple(node_category_index[node] for node in path) for path in node_paths_to_leaf)
+        self.depth = max(len(path) for path in node_paths_to_leaf)   # the number of nodes in a longest path.
+        self._key = (self.node_category_index, self.parent)
+        self._recipes = {}
+        self._recipes_of_category = {}
+
+    @staticmethod
+    def parse(category_indices:List[Any])->(Tuple[int],Tuple[int]):
+        """
+        Parse a nested list [root_index, [child_index, [...], child_index, [...], ...]] (where a node without children
+        is followed by None) into the category index and the parent of each node, in pre-order.
+        """
+        node_category_index, parent = [], []
+        stack = [(category_indices, -1)]
+        while stack:
+            (node_indices, parent_node) = stack.pop()
+            if len(node_indices)%2!=0:
+                raise ValueError("RecipeTree must be initialized with an even-length list, containing indices and their children.")
+            node = len(node_category_index)
+            node_category_index.append(node_indices[0])
+            parent.append(parent_node)
+            children_indices = node_indices[1]
+            if children_indices is not None:
+                if len(children_indices)%2!=0:
+                    raise ValueError("RecipeTree must be initialized with an even-length list, containing indices and their children.")
+                for child_index in range(len(children_indices)-2, -1, -2):
+                    stack.append((children_indices[child_index:child_index+2], node))
+        return (tuple(node_category_index), tuple(parent))
+
+    def __eq__(self, other):
+        return isinstance(other, RecipeStructure) and self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self):
+        return "RecipeStructure(paths={})".format([list(path) for path in self.paths_to_leaf()])
+
+    def children(self, node:int)->List[int]:
+        """
+        :return: the children of the given node, in order.
+        """
+        children = []
+        child = self.first_child[node]
+        while child >= 0:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def paths_to_leaf(self)->Tuple[Tuple[int]]:
+        """
+        :return: the paths from the root to the leaves, as tuples of category indices.
+        """
+        return self._paths_to_leaf
 
+    def node_paths_to_leaf(self)->Tuple[Tuple[int]]:
+        """
+        :return: the paths from the root to the leaves, as tuples of nodes.
+        """
+        return self._node_paths_to_leaf
 
+    def recipes(self, num_categories:int)->Tuple[Tuple[int]]:
+        """
+        :return: the recipes (0/1 vectors of length num_categories), one for each path from the root to a leaf.
+        """
+        if num_categories not in self._recipes:
+            self._recipes[num_categories] = tuple(tuple(RecipeTree.recipe_from_path(path, num_categories)) for path in self.paths_to_leaf())
+        return self._recipes[num_categories]
 
-class RecipeTree (NodeMixin):
+    def recipes_of_category(self, num_categories:int)->Tuple[Tuple[int]]:
+        """
+        :return: the recipe-category incidence matrix in sparse form: for each category g, the indices of the recipes that contain g.
+        """
+        if num_categories not in self._recipes_of_category:
+            recipes_of_category = [[] for _ in range(num_categories)]
+            for (recipe_index, path) in enumerate(self.paths_to_leaf()):
+                for category_index in path:
+                    recipes_of_category[category_index].append(recipe_index)
+            self._recipes_of_category[num_categories] = tuple(tuple(recipe_indices) for recipe_indices in recipes_of_category)
+        return self._recipes_of_category[num_categories]
+
+    def initial_prices(self, num_categories:int, max_price_per_category:float, required_counts:List[int]=None)->List[float]:
+        """
+        :return: initial prices for the recipes of this structure (see prices.calculate_initial_prices_for_recipe_tree, which memoizes them).
+        """
+        from prices import calculate_initial_prices_for_recipe_tree
+        return calculate_initial_prices_for_recipe_tree(self.paths_to_leaf(), num_categories, max_price_per_category, required_counts=required_counts)
+
+
+def recipe_structure(category_indices:Any)->RecipeStructure:
+    """
+    :param category_indices: a nested list representing a recipe-tree (see RecipeTree), or a RecipeStructure.
+    :return: the canonical RecipeStructure of the given nested list, cached process-wide.
+    Both caches hold at most RECIPE_STRUCTURE_CACHE_SIZE structures, so generating many random trees does not grow them without bound.
+
+    >>> recipe_structure([0, [1, None, 2, None]]) is recipe_structure([0, [1, None, 2, None]])
+    True
+    >>> _recipe_structure_memoized.cache_info().maxsize == RECIPE_STRUCTURE_CACHE_SIZE
+    True
+    """
+    if isinstance(category_indices, RecipeStructure):
+        return category_indices
+    # The repr of a nested list is computed in C, so it is a much faster cache key than the parsed structure.
+    try:
+        nested_list_repr = repr(category_indices)
+    except RecursionError:   # a very deep tree
+        return _recipe_structure_memoized(RecipeStructure.parse(category_indices))
+    structure = _recipe_structures_by_repr.get(nested_list_repr)
+    if structure is None:
+        structure = _recipe_structure_memoized(RecipeStructure.parse(category_indices))
+        if len(_recipe_structures_by_repr) >= RECIPE_STRUCTURE_CACHE_SIZE:
+            del _recipe_structures_by_repr[next(iter(_recipe_structures_by_repr))]   # evict the oldest entry
+        _recipe_structures_by_repr[nested_list_repr] = structure
+    return structure
+
+
+RECIPE_STRUCTURE_CACHE_SIZE = 1024
+_recipe_structures_by_repr = {}
+
+
+@functools.lru_cache(maxsize=RECIPE_STRUCTURE_CACHE_SIZE)
+def _recipe_structure_memoized(key:(Tuple[int],Tuple[int]))->RecipeStructure:
+    return RecipeStructure(*key)
+
+
+
+class RecipeTree:
     """
     A tree in which each node is an agent category,
     and each path from root to leaf is a recipe.
@@ -151,48 +343,158 @@ class RecipeTree (NodeMixin):
     ['seller', 'producerA']
     """
 
-    def __init__(self, categories:List[AgentCategory], category_indices:List[Any]):
+    def __init__(self, categories:List[AgentCategory], category_indices:Any, memoize:bool=False, required_counts:List[int]=None):
         """
-        :param category:
-        :param parent:
-        :param children:
-        :param categories:
+        :param categories: a list of categories; the tree refers to them by their index.
+        :param category_indices: a nested list representing the tree: [root_index, [child_index, [...], child_index, [...], ...]],
+                                 where a node without children is followed by None; or a RecipeStructure.
+        :param memoize: if True, the tree caches the aggregates of each node (largest_categories and num_of_deals).
+                        The caller must then call category_changed whenever it changes the agents in a category.
+        :param required_counts: optional list with the number r_g of agents of each category g in a recipe (default: all 1).
+                        Then, each unit of category g is a group of r_g agents: combined_values sums the values of each group,
+                        and num_of_deals and largest_categories count floor(size/r_g) units.
+
+        >>> categories = [AgentCategory("buyer", [90, 80, 70, 60]), AgentCategory("seller", [-1, -2, -3, -4, -5, -6, -7])]
+        >>> tree = RecipeTree(categories, [0, [1, None]], required_counts=[1, 2])
+        >>> tree.combined_values()
+        [87, 73, 59]
+        >>> tree.combined_values_detailed()
+        [(90, -1, -2), (80, -3, -4), (70, -5, -6)]
+        >>> tree.num_of_deals(), tree.largest_categories()
+        (3, (4, 4, ['buyer']))
+        >>> tree.optimal_trade()
+        ([(90, -1, -2), (80, -3, -4), (70, -5, -6)], 3, 219)
+        >>> print(tree.num_of_deals_explained(prices=[10, -5])[1])
+        seller: 3 potential deals, price=-5
+        buyer: 3 out of 4 traders selected, price=10
+        seller: all 3 traders selected
+        3 deals overall
+        <BLANKLINE>
+
+        The structure of the tree is shared by all trees with the same category_indices (see RecipeStructure);
+        the tree itself only binds it to the categories.
         """
-        if len(category_indices)%2!=0:
-            raise ValueError("RecipeTree must be initialized with an even-length list, containing indices and their children.")
-
+        self.structure = structure = recipe_structure(category_indices)
+        self.categories = categories
         self.num_categories = len(categories)
-        self_index = category_indices[0]
-        children_indices = category_indices[1]
-
-        self.category_index = self_index
-        self.category = self_category = categories[self_index]
-        self.name = self_category.name if isinstance(self_category, AgentCategory) else self_category
+        self.memoize = memoize
+
+        self.num_of_nodes = structure.num_of_nodes
+        self.node_category_index = structure.node_category_index
+        self.parent = structure.parent
+        self.first_child = structure.first_child
+        self.next_sibling = structure.next_sibling
+        self.postorder = structure.postorder
+        self.node_categories = [categories[index] for index in structure.node_category_index]
+        self.node_names = [category.name if isinstance(category, AgentCategory) else category for category in self.node_categories]
+        self.required_counts = required_counts
+        if required_counts is None:
+            self.node_required_counts = [1]*self.num_of_nodes
+        else:
+            if any(required_counts[index] < 1 for index in structure.node_category_index):
+                raise ValueError("Required counts must be positive integers: {}".format(required_counts))
+            self.node_required_counts = [required_counts[index] for index in structure.node_category_index]
+
+        if memoize:
+            self._nodes_of_category = collections.defaultdict(list)
+            for node in range(self.num_of_nodes):
+                self._nodes_of_category[self.node_category_index[node]].append(node)
+        # Cached aggregates of each node, cleared when a category in its subtree changes:
+        self._largest_categories_cache = {False: {}, True: {}}
+        self._num_of_deals_cache = {}
+
+    def children(self, node:int)->List[int]:
+        """
+        :return: the children of the given node, in order.
+        """
+        return self.structure.children(node)
 
-        if children_indices is not None:
-            children = []
-            for child_index in range(0,len(children_indices),2):
-                child = RecipeTree(categories, children_indices[child_index:child_index+2])
-                children.append(child)
-            self.children = children
+    def _num_of_units(self, node:int)->int:
+        """
+        :return: the number of units in the category of the given node: floor(size/r), where r is the required count.
+        """
+        return self.node_categories[node].size() // self.node_required_counts[node]
 
+    def _unit_values(self, node:int)->list:
+        """
+        :return: the values of the units in the category of the given node, in descending order.
+        A unit is a group of r consecutive agents (where r is the required count); its value is the sum of their values.
+        The groups are summed as the rows of a strided 2-D view of the values.
+        """
+        values = self.node_categories[node].values
+        required_count = self.node_required_counts[node]
+        if required_count == 1:
+            return values
+        import numpy as np
+        num_of_units = len(values) // required_count
+        return np.asarray(values[:num_of_units*required_count]).reshape(num_of_units, required_count).sum(axis=1).tolist()
+
+    def _unit_deals(self, node:int)->Iterator[Tuple[float,tuple]]:
+        """
+        :return: pairs (sum, values) for the units in the category of the given node, in descending order.
+        """
+        values = self.node_categories[node].values
+        required_count = self.node_required_counts[node]
+        if required_count == 1:
+            return ((a, (a,)) for a in values)
+        unit_values = self._unit_values(node)
+        return zip(unit_values, [tuple(values[start:start+required_count]) for start in range(0, len(unit_values)*required_count, required_count)])
+
+    def category_changed(self, category_index:int):
+        """
+        Notify a memoized tree that the agents in the given category have changed.
+        Marks as dirty only the nodes of this category and their ancestors.
+
+        >>> categories = [AgentCategory("buyer", [9, 8, 7]), AgentCategory("seller", [-1, -2]), AgentCategory("producer", [-3])]
+        >>> tree = RecipeTree(categories, [0, [1, None, 2, None]], memoize=True)
+        >>> tree.largest_categories(), tree.num_of_deals()
+        ((2, 3, ['seller', 'producer']), 3)
+        >>> categories[1].remove_lowest_agent()
+        >>> tree.largest_categories(), tree.num_of_deals()  # not notified yet - the cached aggregates are returned
+        ((2, 3, ['seller', 'producer']), 3)
+        >>> tree.category_changed(1)
+        >>> tree.largest_categories(), tree.num_of_deals()
+        ((3, 3, ['buyer']), 2)
+        """
+        caches = (self._largest_categories_cache[False], self._largest_categories_cache[True], self._num_of_deals_cache)
+        parent = self.parent
+        for node in self._nodes_of_category[category_index]:
+            while node >= 0:
+                for cache in caches:
+                    cache.pop(node, None)
+                node = parent[node]
+
+    def to_anytree(self):
+        """
+        Convert this tree to an anytree.Node, e.g. for displaying it with anytree.RenderTree.
+        anytree is imported only when this method is called.
+
+        >>> categories = [AgentCategory("buyer", [1]), AgentCategory("seller", [-1]), AgentCategory("producerA", [-1]), AgentCategory("producerB", [-1])]
+        >>> from anytree import RenderTree
+        >>> print(RenderTree(RecipeTree(categories, [0, [1, None, 2, [3, None]]]).to_anytree()).by_attr())
+        buyer
+        ├── seller
+        └── producerA
+            └── producerB
+        """
+        from anytree import Node
+        nodes = []
+        for node in range(self.num_of_nodes):   # in pre-order, so each parent is created before its children.
+            parent_node = nodes[self.parent[node]] if self.parent[node] >= 0 else None
+            nodes.append(Node(self.node_names[node], parent=parent_node, category_index=self.node_category_index[node]))
+        return nodes[0]
 
 
-    def paths_to_leaf(self, indices=False, prefix=[]) -> List[List[Any]]:
+    def paths_to_leaf(self, indices=False) -> List[List[Any]]:
         """
-        Get all paths from this node to a leaf.
+        Get all paths from the root to a leaf.
 
         :param indices: if True, each element in the path is a node index. Otherwise, it is the node name.
         """
-        self_id = self.category_index if indices==True else self.name
-        if len(self.children)==0:
-            paths = [prefix + [self_id]]
-        else:
-            paths = []
-            for child in self.children:
-                paths_from_child_to_leaf = child.paths_to_leaf(indices = indices, prefix = prefix + [self_id])
-                paths += paths_from_child_to_leaf
-        return paths
+        if indices==True:
+            return [list(path) for path in self.structure.paths_to_leaf()]
+        node_names = self.node_names
+        return [[node_names[node] for node in path] for path in self.structure.node_paths_to_leaf()]
 
     @staticmethod
     def recipe_from_path(path:List[int], num_categories:int)->List[int]:
@@ -215,8 +517,7 @@ class RecipeTree (NodeMixin):
         Get all recipes (lists of 0 and 1) represented by this recipe-tree.
         Each path from root to leaf represents a single recipe.
         """
-        paths_to_leaf = self.paths_to_leaf(indices=True)
-        return [RecipeTree.recipe_from_path(path, self.num_categories) for path in paths_to_leaf]
+        return [list(recipe) for recipe in self.structure.recipes(self.num_categories)]
 
 
 
@@ -224,37 +525,94 @@ class RecipeTree (NodeMixin):
 
     def combined_values(self) -> list:
         """
-        Combine the values in all categories of the current subtree into a single value-list.
+        Combine the values in all categories of the tree into a single value-list.
         Categories in siblings are combined by uniting the sets and sorting it in descending order.
         Categories in parent-child are combined by sorting each set in descending order and creating elementwise sums.
+
+        The children's value-lists are already sorted in descending order, so they are combined by a k-way merge,
+        and only as many values are taken as the parent category can be paired with.
         """
-        self_values = self.category.values
-        if len(self.children) == 0:
-            values = self_values
-        else:
-            children_values = sum([child.combined_values() for child in self.children], [])
-            children_values.sort(reverse=True)
-            values = [a+b for (a,b) in zip(self_values, children_values)]
-        return values
+        node_categories, first_child = self.node_categories, self.first_child
+        values = [None]*self.num_of_nodes
+        for node in self.postorder:
+            self_values = self._unit_values(node)
+            if first_child[node] < 0:
+                values[node] = self_values
+            else:
+                children = self.children(node)
+                children_values = heapq.merge(*[values[child] for child in children], reverse=True)
+                values[node] = [a+b for (a,b) in zip(self_values, children_values)]
+                for child in children:
+                    values[child] = None
+        return values[0]
 
 
     def combined_values_detailed(self) -> list:
         """
-        Combine the values in all categories of the current subtree into a single value-list.
+        Combine the values in all categories of the tree into a single value-list.
         Categories in siblings are combined by uniting the sets and sorting it in descending order.
         Categories in parent-child are combined by sorting each set in descending order and creating elementwise sums.
 
         Similar to combined_values, but keeps all the summed-up values instead of just the sum.
         """
-        self_values = self.category.values
-        if len(self.children) == 0:
-            values = self_values
-        else:
-            children_values = sum([child.combined_values_detailed() for child in self.children], [])
-            # logger.debug("children_values: %s",children_values)
-            children_values.sort(reverse=True, key=lambda x: sum(x) if (isinstance(x,list) or isinstance(x,tuple)) else x)
-            values = [tuple(flatten(t)) for t in zip(self_values, children_values)]
-        return values
+        if self.first_child[0] < 0 and self.node_required_counts[0] == 1:
+            return self.node_categories[0].values
+        return [values for (_, values) in self._combined_deals()]
+
+    def _combined_deals(self) -> List[Tuple[float,tuple]]:
+        """
+        :return: the combined deals as pairs (sum, values).
+        The sum is carried along with the values, so that the merge does not have to re-sum the values in each comparison.
+        """
+        node_categories, first_child = self.node_categories, self.first_child
+        deals = [None]*self.num_of_nodes
+        for node in self.postorder:
+            self_deals = self._unit_deals(node)
+            if first_child[node] < 0:
+                deals[node] = self_deals
+            else:
+                children = self.children(node)
+                children_deals = heapq.merge(*[deals[child] for child in children], key=operator.itemgetter(0), reverse=True)
+                deals[node] = [(a+children_sum, values+children_values) for ((a,values),(children_sum,children_values)) in zip(self_deals, children_deals)]
+                for child in children:
+                    deals[child] = None
+        return list(deals[0])
+
+    def _iter_combined_deals(self, detailed:bool=True)->Iterator:
+        """
+        A lazy version of _combined_deals (if detailed) or of combined_values (if not detailed).
+        Each node pulls deals from its children only when its own parent pulls a deal from it,
+        through a max-heap merge of its children's streams (heapq.merge), so taking the best k deals
+        costs O(k * depth * log(fan-out)), regardless of the total number of agents.
+
+        Pulling a deal goes through a chain of generators as long as the tree depth,
+        so use it only on trees that are shallow relative to the recursion limit (see _is_shallow).
+        """
+        node_categories, first_child = self.node_categories, self.first_child
+        streams = [None]*self.num_of_nodes
+        for node in self.postorder:
+            if first_child[node] < 0:
+                if detailed:
+                    streams[node] = self._unit_deals(node)
+                else:
+                    streams[node] = iter(self._unit_values(node))
+                continue
+            children_streams = [streams[child] for child in self.children(node)]
+            if detailed:
+                children_deals = children_streams[0] if len(children_streams)==1 else heapq.merge(*children_streams, key=operator.itemgetter(0), reverse=True)
+                streams[node] = ((a+children_sum, values+children_values) for ((a,values),(children_sum,children_values)) in zip(self._unit_deals(node), children_deals))
+            else:
+                children_values = children_streams[0] if len(children_streams)==1 else heapq.merge(*children_streams, reverse=True)
+                streams[node] = map(operator.add, self._unit_values(node), children_values)
+            for child in self.children(node):
+                streams[child] = None
+        return streams[0]
+
+    def _is_shallow(self)->bool:
+        """
+        :return: True if the tree is shallow enough for the generator chains of _iter_combined_deals.
+        """
+        return 4*self.structure.depth < sys.getrecursionlimit()
 
     def optimal_trade(self)->(list,int,float):
         """
@@ -262,18 +620,30 @@ class RecipeTree (NodeMixin):
         * first element is the list of deals in the optimal trade;
         * second element is the optimal num of deals (k);
         * third is the optimal GFT.
+
+        The deals are pulled lazily in descending order of their sum, until the first non-positive deal;
+        so the running time is proportional to k rather than to the total number of agents.
+
+        >>> categories = [AgentCategory("buyer", [60,40,20,-30]), AgentCategory("seller", [-10,-30,-50]), AgentCategory("producerA", [-1, -3, -5]), AgentCategory("producerB", [-2, -4, -6, -8])]
+        >>> RecipeTree(categories, [0, [1, None, 2, [3, None]]]).optimal_trade()
+        ([(60, -1, -2), (40, -3, -4), (20, -10)], 3, 100)
+        >>> RecipeTree(categories, [0, None]).optimal_trade()
+        ([(60,), (40,), (20,)], 3, 120)
         """
-        values = self.combined_values_detailed()
-        optimal_trade_values = [t for t in values if sum(t)>0]
+        deals = self._iter_combined_deals() if self._is_shallow() else self._combined_deals()
+        optimal_trade_deals = list(itertools.takewhile(lambda deal: deal[0] > 0, deals))
+        optimal_trade_values = [values for (_, values) in optimal_trade_deals]
         optimal_trade_count = len(optimal_trade_values)
-        optimal_trade_values_GFT = sum(flatten(optimal_trade_values))
+        optimal_trade_values_GFT = sum([deal_sum for (deal_sum, _) in optimal_trade_deals])
         return (optimal_trade_values, optimal_trade_count, optimal_trade_values_GFT)
 
     def optimal_trade_GFT(self) -> int:
         """
         Calculate the maximum possible GFT for the given category tree.
+        Like optimal_trade, it pulls the combined values lazily, until the first non-positive one.
         """
-        return sum([v for v in self.combined_values() if v > 0])
+        values = self._iter_combined_deals(detailed=False) if self._is_shallow() else self.combined_values()
+        return sum(itertools.takewhile(lambda value: value > 0, values))
 
 
     def largest_categories(self, indices=False) -> (int,list):
@@ -339,28 +709,34 @@ class RecipeTree (NodeMixin):
         >>> tree.largest_categories(indices=True)[-1]
         [4]
         """
-        self_category_size = self.category.size()
-        self_category_index_or_name = self.category_index if indices else self.name
-
-        children_category_size = sum([child.category.size() for child in self.children], 0)
-        # print("self_category_size: ",self_category_size)
-        # print("children_category_size: ",children_category_size)
-        if self_category_size > children_category_size or children_category_size==0:
-            largest_category_size = combined_category_size = self_category_size
-            largest_categories = [self_category_index_or_name]
-        else:
-            children_combined_category_size = 0
+        num_of_units, ids = self._num_of_units, (self.node_category_index if indices else self.node_names)
+        results = self._largest_categories_cache[indices] if self.memoize else {}
+        stack = [0]
+        while stack:
+            node = stack[-1]
+            if node in results:
+                stack.pop()
+                continue
+            self_category_size = num_of_units(node)
+            children = self.children(node)
+            children_category_size = sum([num_of_units(child) for child in children], 0)
+            if self_category_size > children_category_size or children_category_size==0:
+                results[node] = (self_category_size, self_category_size, [ids[node]])
+                stack.pop()
+                continue
+            children_to_compute = [child for child in children if child not in results]
+            if children_to_compute:
+                stack += reversed(children_to_compute)
+                continue
             children_largest_category_size = 0
             children_largest_categories = []
-            for child in self.children:
-                (child_largest_category_size, child_combined_category_size, child_largest_categories) = child.largest_categories(indices=indices)
+            for child in children:
+                (child_largest_category_size, _, child_largest_categories) = results[child]
                 children_largest_category_size = max(children_largest_category_size,child_largest_category_size)
-                children_combined_category_size += child_combined_category_size
                 children_largest_categories += child_largest_categories
-            largest_category_size = children_largest_category_size
-            combined_category_size = self_category_size
-            largest_categories = children_largest_categories
-        return (largest_category_size, combined_category_size, largest_categories)
+            results[node] = (children_largest_category_size, self_category_size, children_largest_categories)
+            stack.pop()
+        return results[0]
 
 
     def num_of_deals(self)->int:
@@ -368,52 +744,184 @@ class RecipeTree (NodeMixin):
         Calculates the maximum number of deals that can be done using the recipes in this recipe-tree.
         :return:
         """
-        self_num_of_deals = self.category.size()
-        if len(self.children) == 0:
-            num_of_deals = self_num_of_deals
-        else:
-            sum_children_num_of_deals = sum([child.num_of_deals() for child in self.children])
-            num_of_deals = min(sum_children_num_of_deals,self_num_of_deals)
-        return num_of_deals
+        if not self.memoize:
+            return self.num_of_deals_per_node()[0]
+        results = self._num_of_deals_cache
+        stack = [0]
+        while stack:
+            node = stack[-1]
+            if node in results:
+                stack.pop()
+                continue
+            children = self.children(node)
+            children_to_compute = [child for child in children if child not in results]
+            if children_to_compute:
+                stack += children_to_compute
+                continue
+            self_num_of_deals = self._num_of_units(node)
+            if len(children) == 0:
+                results[node] = self_num_of_deals
+            else:
+                sum_children_num_of_deals = sum([results[child] for child in children])
+                results[node] = min(sum_children_num_of_deals,self_num_of_deals)
+            stack.pop()
+        return results[0]
 
+    def num_of_deals_per_node(self)->List[int]:
+        """
+        Calculates, for each node, the maximum number of deals that can be done using the recipes in its subtree.
+        :return: a list indexed by node; its element 0 is the number of deals in the whole tree.
+
+        >>> categories = [AgentCategory("buyer", [17, 14, 13, 9, 6]), AgentCategory("seller", [-1, -3]), AgentCategory("producer", [-1, -3, -5])]
+        >>> RecipeTree(categories, [0, [1, None, 2, None]]).num_of_deals_per_node()
+        [5, 2, 3]
+        >>> RecipeTree(categories, [2, [0, [1, None]]]).num_of_deals_per_node()
+        [2, 2, 2]
+        """
+        first_child, next_sibling = self.first_child, self.next_sibling
+        num_of_deals = [None]*self.num_of_nodes
+        for node in self.postorder:
+            self_num_of_deals = self._num_of_units(node)
+            child = first_child[node]
+            if child < 0:
+                num_of_deals[node] = self_num_of_deals
+                continue
+            sum_children_num_of_deals = 0
+            while child >= 0:
+                sum_children_num_of_deals += num_of_deals[child]
+                child = next_sibling[child]
+            num_of_deals[node] = min(sum_children_num_of_deals,self_num_of_deals)
+        return num_of_deals
 
-    def num_of_deals_explained(self, prices:List[float], add_num_of_overall_deals=True)->str:
+    def explain_num_of_deals(self, num_of_deals_per_node:List[int], prices:List[float], add_num_of_overall_deals=True)->str:
         """
-        Return a detailed explanation of the number of deals done,
+        Render a detailed explanation of the number of deals done,
         including what categories require randomization.
+        :param num_of_deals_per_node: the output of num_of_deals_per_node.
         :return: A representation string.
+
+        The lines of each node come after the lines of all its descendants, so they are emitted in post-order.
         """
-        self_num_of_deals = self.category.size()
-        self_price = prices[self.category_index]
-        if len(self.children) == 0:
-            num_of_deals = self_num_of_deals
-            explanation = "{}: {} potential deals, price={}\n".format(self.name, self_num_of_deals, self_price)
-        else:
-            children_num_of_deals_explained = [child.num_of_deals_explained(prices,add_num_of_overall_deals=False) for child in self.children]
-            # logger.debug(children_num_of_deals_explained)
-            children_num_of_deals = [t[0] for t in children_num_of_deals_explained]
-            sum_children_num_of_deals = sum(children_num_of_deals)
-            # logger.debug(children_num_of_deals)
-            children_explanations = [t[1] for t in children_num_of_deals_explained]
-            # logger.debug(children_explanations)
-            children_names = [child.name for child in self.children]
-            sum_children_names = " + ".join(children_names)
-            num_of_deals = min(sum_children_num_of_deals,self_num_of_deals)
-            explanation = "".join(children_explanations)
-            if num_of_deals==self_num_of_deals:
-                explanation += "{}: all {} traders selected, price={}\n".format(self.name, self_num_of_deals, self_price)
+        node_categories, node_names, children_of = self.node_categories, self.node_names, self.children
+        lines = []
+        for node in self.postorder:
+            self_num_of_traders = node_categories[node].size()
+            self_price = prices[self.node_category_index[node]]
+            children = children_of(node)
+            if len(children) == 0:
+                lines.append("{}: {} potential deals, price={}\n".format(node_names[node], num_of_deals_per_node[node], self_price))
+                continue
+            sum_children_num_of_deals = sum([num_of_deals_per_node[child] for child in children])
+            sum_children_names = " + ".join([node_names[child] for child in children])
+            node_num_of_deals = num_of_deals_per_node[node]
+            num_of_selected_traders = node_num_of_deals * self.node_required_counts[node]
+            if num_of_selected_traders==self_num_of_traders:
+                lines.append("{}: all {} traders selected, price={}\n".format(node_names[node], self_num_of_traders, self_price))
             else:
-                explanation += "{}: {} out of {} traders selected, price={}\n".format(self.name, num_of_deals, self_num_of_deals, self_price)
-            if num_of_deals == sum_children_num_of_deals:
-                explanation += "{}: all {} traders selected\n".format(sum_children_names, sum_children_num_of_deals)
+                lines.append("{}: {} out of {} traders selected, price={}\n".format(node_names[node], num_of_selected_traders, self_num_of_traders, self_price))
+            if node_num_of_deals == sum_children_num_of_deals:
+                lines.append("{}: all {} traders selected\n".format(sum_children_names, sum_children_num_of_deals))
             else:
-                explanation += "{}: {} out of {} traders selected\n".format(sum_children_names, num_of_deals, sum_children_num_of_deals)
+                lines.append("{}: {} out of {} traders selected\n".format(sum_children_names, node_num_of_deals, sum_children_num_of_deals))
         if add_num_of_overall_deals:
-            explanation += "{} deals overall\n".format(num_of_deals)
-        return (num_of_deals,explanation)
+            lines.append("{} deals overall\n".format(num_of_deals_per_node[0]))
+        return "".join(lines)
+
+    def num_of_deals_explained(self, prices:List[float], add_num_of_overall_deals=True)->(int,str):
+        """
+        Return the number of deals, and a detailed explanation of it (see explain_num_of_deals).
+        """
+        num_of_deals_per_node = self.num_of_deals_per_node()
+        return (num_of_deals_per_node[0], self.explain_num_of_deals(num_of_deals_per_node, prices, add_num_of_overall_deals))
 
 
 
+def random_recipe_struct(num_of_categories:int, max_depth:int, max_fanout:int)->List[Any]:
+    """
+    Generate a random recipe-tree structure (a nested list, see RecipeTree) with the given number of categories.
+    The tree grows by repeatedly adding a child to a random node whose depth and number of children are below the limits.
+    Category 0 is the root; the other categories are numbered in the order in which they were added.
+
+    :param num_of_categories: the number of nodes in the tree.
+    :param max_depth: the maximum number of nodes in a path from the root to a leaf.
+    :param max_fanout: the maximum number of children of a node.
+
+    >>> import random
+    >>> random.seed(1)
+    >>> random_recipe_struct(6, max_depth=3, max_fanout=2)
+    [0, [1, [4, None], 2, [3, None, 5, None]]]
+    >>> structure = recipe_structure(random_recipe_struct(1000, max_depth=6, max_fanout=5))
+    >>> structure.num_of_nodes, max(len(path) for path in structure.paths_to_leaf()) <= 6, max(len(structure.children(node)) for node in range(1000)) <= 5
+    (1000, True, True)
+    >>> random_recipe_struct(4, max_depth=2, max_fanout=2)
+    Traceback (most recent call last):
+    ...
+    ValueError: A tree with depth at most 2 and fan-out at most 2 cannot have 4 nodes
+    """
+    import random
+    depth = [1]
+    children = [[]]
+    open_nodes = [0] if max_depth > 1 and max_fanout > 0 else []   # nodes that can get another child.
+    for node in range(1, num_of_categories):
+        if len(open_nodes) == 0:
+            raise ValueError("A tree with depth at most {} and fan-out at most {} cannot have {} nodes".format(max_depth, max_fanout, num_of_categories))
+        open_index = random.randrange(len(open_nodes))
+        parent = open_nodes[open_index]
+        children[parent].append(node)
+        if len(children[parent]) >= max_fanout:
+            open_nodes[open_index] = open_nodes[-1]
+            open_nodes.pop()
+        depth.append(depth[parent]+1)
+        children.append([])
+        if depth[node] < max_depth:
+            open_nodes.append(node)
+
+    # Build the nested lists bottom-up (each node is added after its parent), to avoid recursion in deep trees.
+    structs = [None]*num_of_categories
+    for node in reversed(range(num_of_categories)):
+        children_struct = None
+        if children[node]:
+            children_struct = []
+            for child in children[node]:
+                children_struct += structs[child]
+        structs[node] = [node, children_struct]
+    return structs[0]
+
+
+def random_recipe_tree_market(num_of_categories:int, max_depth:int, max_fanout:int, num_of_agents_per_path:int,
+                              buyer_value_range:Tuple[float,float]=None, seller_value_range:Tuple[float,float]=(-100,0)):
+    """
+    Generate a random recipe-tree structure (see random_recipe_struct) with a random market attached.
+    Category 0 (the root) contains buyers with values in buyer_value_range (default: up to 100 per level of the tree);
+    the other categories contain sellers with values in seller_value_range.
+    Each category has num_of_agents_per_path agents for each path through its node,
+    so that the categories in all levels of the tree are balanced.
+
+    :return: a tuple (market, recipe struct).
+
+    >>> import random
+    >>> random.seed(1)
+    >>> (market, struct) = random_recipe_tree_market(6, max_depth=3, max_fanout=2, num_of_agents_per_path=2)
+    >>> struct
+    [0, [1, [4, None], 2, [3, None, 5, None]]]
+    >>> [category.size() for category in market.categories]
+    [6, 2, 4, 2, 2, 2]
+    """
+    from markets import Market
+    import random
+    struct = random_recipe_struct(num_of_categories, max_depth, max_fanout)
+    structure = recipe_structure(struct)
+    num_of_paths = [0]*num_of_categories
+    for path in structure.paths_to_leaf():
+        for category_index in path:
+            num_of_paths[category_index] += 1
+    if buyer_value_range is None:
+        buyer_value_range = (0, 100*max_depth)
+    categories = [AgentCategory.uniformly_random("buyer", num_of_agents_per_path*num_of_paths[0], *buyer_value_range)]
+    for category_index in range(1, num_of_categories):
+        categories.append(AgentCategory.uniformly_random("seller{}".format(category_index), num_of_agents_per_path*num_of_paths[category_index], *seller_value_range))
+    return (Market(categories), struct)
+
 
 
 if __name__=="__main__":
@@ -433,7 +941,8 @@ if __name__=="__main__":
     tree = RecipeTree(categories, [0, [1, None, 2, [3, None]]])   # buyer -> seller, buyer -> producerA -> producerB
 
     print("Tree structure: ")
-    for pre, fill, node in RenderTree(tree):
+    from anytree import RenderTree
+    for pre, fill, node in RenderTree(tree.to_anytree()):
         print("{}{}".format(pre,node.name))
     # buyer
     # ├── seller
@@ -0,0 +1,84 @@
+#!python3
+
+"""
+A benchmark of RecipeTree and of the recipe-tree ascending auction on random recipe-trees of growing size
+(see recipetree.random_recipe_tree_market).
+
+For each tree size, it reports the time (in seconds) and the peak memory allocated (in KB, measured by tracemalloc)
+of combined_values, largest_categories, optimal_trade, the reference MILP solver (recipeset.optimal_trade) and the full auction.
+Time and memory are measured in separate runs, since tracemalloc slows the code down considerably.
+
+Usage:  python recipetree_benchmark.py [max_num_of_categories [max_auction_categories]]
+"""
+
+from recipetree import RecipeTree, random_recipe_tree_market
+import ascending_auction_recipetree_protocol, recipeset
+from ascending_auction_recipetree_protocol import budget_balanced_ascending_auction
+
+import logging, random, sys, time, tracemalloc
+import numpy, scipy.optimize   # imported lazily by the measured code; imported here so that their import time is not measured.
+ascending_auction_recipetree_protocol.logger.setLevel(logging.WARNING)
+
+NUMS_OF_CATEGORIES = [10, 30, 100, 300, 1000, 3000]
+MAX_DEPTH = 8
+MAX_FANOUT = 4
+NUM_OF_AGENTS_PER_PATH = 3
+MAX_AUCTION_CATEGORIES = 1000   # the auction with 3000 categories takes over a minute per run (and several minutes under tracemalloc).
+MAX_MILP_CATEGORIES = 1000      # the MILP takes about half a second per run with 1000 categories, and grows super-linearly.
+
+TABLE_COLUMNS = ["num_of_categories", "num_of_paths", "num_of_agents", "operation", "time", "peak_memory_kb"]
+
+
+def measure(function)->(float,float):
+    """
+    :return: the time (in seconds) and the peak memory allocated (in KB) when running the given function.
+    """
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    (_, peak_memory) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (elapsed, peak_memory/1024)
+
+
+def benchmark(num_of_categories:int, include_auction:bool=True, include_milp:bool=True)->list:
+    """
+    Generate a random market with a recipe-tree of the given size, and measure the operations on it.
+    :param include_auction: whether to measure the full auction too.
+    :param include_milp: whether to measure the reference MILP solver too.
+    :return: a list of rows, with the values of TABLE_COLUMNS.
+    """
+    random.seed(num_of_categories)
+    (market, struct) = random_recipe_tree_market(num_of_categories, MAX_DEPTH, MAX_FANOUT, NUM_OF_AGENTS_PER_PATH)
+    tree = RecipeTree(market.categories, struct)
+    num_of_paths = len(tree.paths_to_leaf(indices=True))
+    num_of_agents = sum(category.size() for category in market.categories)
+    operations = [
+        ("combined_values", tree.combined_values),
+        ("largest_categories", lambda: tree.largest_categories(indices=True)),
+        ("optimal_trade", tree.optimal_trade),
+    ]
+    if include_milp:
+        recipes = tree.recipes()
+        operations.append(("optimal_trade_milp", lambda: recipeset.optimal_trade(market.categories, recipes)))
+    if include_auction:
+        operations.append(("auction", lambda: budget_balanced_ascending_auction(market, struct)))
+    rows = []
+    for (name, function) in operations:
+        (elapsed, peak_memory_kb) = measure(function)
+        rows.append([num_of_categories, num_of_paths, num_of_agents, name, elapsed, peak_memory_kb])
+    return rows
+
+
+if __name__ == "__main__":
+    max_num_of_categories = int(sys.argv[1]) if len(sys.argv) > 1 else NUMS_OF_CATEGORIES[-1]
+    max_auction_categories = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_AUCTION_CATEGORIES
+    print("".join("{:>20}".format(column) for column in TABLE_COLUMNS))
+    for num_of_categories in NUMS_OF_CATEGORIES:
+        if num_of_categories > max_num_of_categories:
+            break
+        for row in benchmark(num_of_categories, include_auction=num_of_categories <= max_auction_categories, include_milp=num_of_categories <= MAX_MILP_CATEGORIES):
+            print("{:>20}{:>20}{:>20}{:>20}{:>20.4f}{:>20.1f}".format(*row))
+        sys.stdout.flush()
@@ -0,0 +1,103 @@
+#!python3
+
+"""
+Unit-test for the startup cost of the auction modules.
+Short-lived clearing workers import the protocol modules constantly,
+so importing them (and running a single-recipe or recipe-tree auction) must not load heavy libraries such as scipy.
+
+The import time is bounded only loosely, relative to the startup time of a bare interpreter on the same machine,
+so that the bound holds on slow or loaded machines but still catches a heavy import (importing scipy.optimize takes about 30 times a bare startup).
+Run with "python startup_time_test.py" to also print the measured import times.
+"""
+
+import subprocess, sys, os, json, time, unittest
+
+NUM_OF_MEASUREMENTS = 3
+
+# A fresh interpreter that imports a protocol module may take at most this many times as long as a bare fresh interpreter.
+# Currently the ratio is about 3.
+MAX_STARTUP_TIME_RATIO = 6
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run_in_fresh_interpreter(code:str)->dict:
+    """
+    Run the given code in a new Python process, and return the dict that it prints as JSON.
+    """
+    output = subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_import_time(module_name:str)->dict:
+    """
+    :return: a dict with the time (in seconds) of importing the given module in a fresh interpreter,
+             and the heavy modules that were loaded as a result.
+    """
+    return _run_in_fresh_interpreter(f"""
+import time, sys, json
+start = time.perf_counter()
+import {module_name}
+import_time = time.perf_counter() - start
+print(json.dumps({{"import_time": import_time, "scipy": "scipy" in sys.modules, "numpy": "numpy" in sys.modules}}))
+""")
+
+
+def measure_startup_time(code:str)->float:
+    """
+    :return: the wall-clock time (in seconds) of running the given code in a fresh interpreter, best of NUM_OF_MEASUREMENTS.
+    """
+    times = []
+    for _ in range(NUM_OF_MEASUREMENTS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class TestStartupTime(unittest.TestCase):
+
+    def test_import_time_is_close_to_bare_startup(self):
+        bare_time = measure_startup_time("pass")
+        for module_name in ["ascending_auction_protocol", "ascending_auction_recipetree_protocol"]:
+            import_time = measure_startup_time("import " + module_name)
+            self.assertLessEqual(import_time, MAX_STARTUP_TIME_RATIO * bare_time,
+                "{}: {:.1f} ms, bare interpreter: {:.1f} ms".format(module_name, 1000*import_time, 1000*bare_time))
+
+    def test_import_does_not_load_scipy_or_numpy(self):
+        for module_name in ["ascending_auction_protocol", "ascending_auction_recipetree_protocol", "prices"]:
+            result = measure_import_time(module_name)
+            self.assertFalse(result["scipy"], module_name)
+            self.assertFalse(result["numpy"], module_name)
+
+    def test_auctions_do_not_load_scipy(self):
+        result = _run_in_fresh_interpreter("""
+import sys, json
+from markets import Market
+from agents import AgentCategory
+import ascending_auction_protocol, ascending_auction_recipetree_protocol
+market = Market([AgentCategory("buyer", [9., 8.]), AgentCategory("seller", [-4., -3.])])
+ascending_auction_protocol.budget_balanced_ascending_auction(market, [1, 1])
+market = Market([AgentCategory("buyer", [9., 8.]), AgentCategory("seller", [-4., -3.]), AgentCategory("seller2", [-2., -1.])])
+ascending_auction_recipetree_protocol.budget_balanced_ascending_auction(market, [0, [1, None, 2, None]])
+print(json.dumps({"scipy": "scipy" in sys.modules}))
+""")
+        self.assertFalse(result["scipy"])
+
+    def test_lp_loads_scipy_on_first_use(self):
+        result = _run_in_fresh_interpreter("""
+import sys, json
+import prices
+before = "scipy" in sys.modules
+prices.calculate_initial_prices([[1, 1, 0], [1, 0, 1]], -100)
+print(json.dumps({"before": before, "after": "scipy" in sys.modules}))
+""")
+        self.assertEqual(result, {"before": False, "after": True})
+
+
+if __name__ == '__main__':
+    for module_name in ["prices", "ascending_auction_protocol", "ascending_auction_recipetree_protocol", "ascending_auction_recipetree_twolevels_protocol"]:
+        times = [measure_import_time(module_name)["import_time"] for _ in range(NUM_OF_MEASUREMENTS)]
+        print("import {}: {:.1f} ms (best of {})".format(module_name, 1000*min(times), NUM_OF_MEASUREMENTS))
+    unittest.main()
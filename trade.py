@@ -14,7 +14,7 @@ Since: 2019-08
 
 
 import math
-from agents import AgentCategory
+from agents import AgentCategory, abbreviated_list_str
 from typing import *
 
 class Trade:
@@ -24,6 +24,10 @@ class Trade:
     This may be the output of an auction mechanism, or an algorithm for computing optimal trade.
     """
 
+    # The optimal trade in the same market, for comparison.
+    # Attached by auctions that are run with diagnostics=True; None otherwise.
+    optimal_trade = None
+
     def num_of_deals(self) -> int:
         """
         :return: the number of deals done in this Trade.
@@ -64,7 +68,7 @@ class TradeWithMaterialBalance (Trade):
         return sum([sum(ps) for ps in self.procurement_sets])
 
     def __repr__(self):
-        return "{} deals: {}".format(self.num_of_deals(), self.procurement_sets)
+        return "{} deals: {}".format(self.num_of_deals(), abbreviated_list_str(self.procurement_sets))
 
 
 
@@ -132,6 +136,61 @@ class TradeWithSinglePrice (Trade):
                 gft -= price_per_agent_per_deal*participating_agents_in_category
         return gft
 
+    def agent_outcomes(self, original_categories:List[AgentCategory])->tuple:
+        """
+        Calculate the outcome of every agent in the original market, including agents who were eliminated.
+        Agents are ordered by category, and inside each category in descending order of value,
+        i.e., the outcome arrays are aligned with numpy.concatenate([category.values for category in original_categories]).
+
+        :param original_categories: the agent categories of the market before the trade (e.g. market.categories).
+            The i-th category of this trade must contain a subset of the agents in the i-th original category.
+        :return: a tuple of three numpy arrays:
+            * the probability of each agent to trade;
+            * the expected payment of each agent (probability times price);
+            * the expected utility of each agent (probability times value-minus-price).
+
+        >>> original = [AgentCategory("buyer", [7,5,4,3,2]), AgentCategory("seller",[-1,-3,-5,-6])]
+        >>> t = TradeWithSinglePrice([AgentCategory("buyer", [7,5,4]), AgentCategory("seller",[-1,-3])], [1,1], [4,-4])
+        >>> (probabilities, payments, utilities) = t.agent_outcomes(original)
+        >>> probabilities.round(3).tolist()
+        [0.667, 0.667, 0.667, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0]
+        >>> payments.round(3).tolist()
+        [2.667, 2.667, 2.667, 0.0, 0.0, -4.0, -4.0, 0.0, 0.0]
+        >>> utilities.round(3).tolist()
+        [2.0, 0.667, 0.0, 0.0, 0.0, 3.0, 1.0, 0.0, 0.0]
+
+        >>> # Equal values are matched by multiplicity:
+        >>> t = TradeWithSinglePrice([AgentCategory("buyer", [5,5]), AgentCategory("seller",[-1,-3])], [1,1], [4,-4])
+        >>> t.agent_outcomes([AgentCategory("buyer", [5,5,5]), AgentCategory("seller",[-1,-3])])[0].tolist()
+        [1.0, 1.0, 0.0, 1.0, 1.0]
+        """
+        import numpy as np
+        if len(original_categories) != self.num_categories:
+            raise ValueError("The trade has {} categories but the original market has {}".format(self.num_categories, len(original_categories)))
+        probabilities, payments, utilities = [], [], []
+        for (category, original_category, count_in_recipe, price) in zip(self.categories, original_categories, self.ps_recipe, self.prices):
+            original_values = np.asarray(original_category.values, dtype=float)   # descending
+            category_probabilities = np.zeros(len(original_values))
+            category_payments = np.zeros(len(original_values))
+            category_utilities = np.zeros(len(original_values))
+            if count_in_recipe > 0 and self.num_of_deals_cache > 0:
+                # An original agent trades if its value appears in the remaining category;
+                # with repeated values, only as many copies as remain in the category are counted.
+                negated_original = -original_values          # ascending
+                negated_remaining = -np.asarray(category.values, dtype=float)
+                rank_among_equal = np.arange(len(negated_original)) - np.searchsorted(negated_original, negated_original, side="left")
+                count_in_remaining = np.searchsorted(negated_remaining, negated_original, side="right") - \
+                                     np.searchsorted(negated_remaining, negated_original, side="left")
+                probability_to_participate = count_in_recipe * self.num_of_deals_cache / len(category)
+                trading = rank_among_equal < count_in_remaining
+                category_probabilities[trading] = probability_to_participate
+                category_payments[trading] = probability_to_participate * price
+                category_utilities[trading] = probability_to_participate * (original_values[trading] - price)
+            probabilities.append(category_probabilities)
+            payments.append(category_payments)
+            utilities.append(category_utilities)
+        return (np.concatenate(probabilities), np.concatenate(payments), np.concatenate(utilities))
+
     def __repr__(self):
         if self.num_of_deals_cache==0:
             return "No trade"
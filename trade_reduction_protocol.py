@@ -141,8 +141,8 @@ def budget_balanced_trade_reduction(market:Market, ps_recipe:list):
     for category in remaining_market.categories:
         if len(category)==0:
             category.append(-MAX_VALUE)
-    logger.info("Optimal trade, by increasing GFT: {}".format(optimal_trade))
-    logger.info("Remaining market: {}".format(remaining_market))
+    logger.info("Optimal trade, by increasing GFT: %s", optimal_trade)
+    logger.info("Remaining market: %s", remaining_market)
 
     actual_traders = market.empty_agent_categories()
 
@@ -150,34 +150,34 @@ def budget_balanced_trade_reduction(market:Market, ps_recipe:list):
     for ps in optimal_trade.procurement_sets:
         ps = list(ps)
         if latest_prices is None:
-            logger.info("\nCalculating prices for PS {}:".format(ps))
+            logger.info("\nCalculating prices for PS %s:", ps)
             for pivot_index in range(len(ps)):
                 pivot_value = ps[pivot_index]
                 pivot_category = market.categories[pivot_index]
-                logger.info("  Looking for external competition to {} with value {}:".
-                      format(pivot_category.name, pivot_value))
+                logger.info("  Looking for external competition to %s with value %s:",
+                      pivot_category.name, pivot_value)
                 best_containing_PS = remaining_market.best_containing_PS(pivot_index, pivot_value)
                 best_containing_GFT = sum(best_containing_PS)
                 if best_containing_GFT > 0:  # EXTERNAL COMPETITION - KEEP TRADER
-                    logger.info("    best PS is {} with GFT {}. It is positive so it is an external competition.".
-                          format(best_containing_PS, best_containing_GFT))
+                    logger.info("    best PS is %s with GFT %s. It is positive so it is an external competition.",
+                          best_containing_PS, best_containing_GFT)
                     prices = market.calculate_prices_by_external_competition(pivot_index, pivot_value, best_containing_PS)
-                    logger.info("    Prices are {}".format(prices))
+                    logger.info("    Prices are %s", prices)
                     latest_prices = prices
                     for i in range(market.num_categories):
                         if ps[i] is not None:
                             actual_traders[i].append(ps[i])
                     break  # done with current PS - move to next PS
                 else:  # NO EXTERNAL COMPETITION - REMOVE TRADER
-                    logger.info("    Best PS is {} with GFT {}. It is negative so it is not an external competition.".
-                          format(best_containing_PS, best_containing_GFT))
-                    logger.info("    Remove {} {} from trade and add to remaining market".
-                          format(pivot_category.name, pivot_value))
+                    logger.info("    Best PS is %s with GFT %s. It is negative so it is not an external competition.",
+                          best_containing_PS, best_containing_GFT)
+                    logger.info("    Remove %s %s from trade and add to remaining market",
+                          pivot_category.name, pivot_value)
                     ps[pivot_index] = None
                     remaining_market.append_trader(pivot_index, pivot_value)
-                    logger.info("    Remaining market is now: {}".format(remaining_market))
+                    logger.info("    Remaining market is now: %s", remaining_market)
         else:
-            logger.info("\nPrices for PS {} are {}".format(ps, latest_prices))
+            logger.info("\nPrices for PS %s are %s", ps, latest_prices)
             for i in range(market.num_categories):
                 if ps[i] is not None:
                     actual_traders[i].append(ps[i])